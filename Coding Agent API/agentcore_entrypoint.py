@@ -6,6 +6,10 @@ This wraps the existing agent (which uses OpenRouter for the LLM and E2B for the
 sandbox) with Amazon Bedrock AgentCore Runtime. It keeps your current logic and
 models untouched and simply exposes a runtime-compatible entrypoint.
 
+By default the entrypoint returns a single JSON summary of the run. Send
+"stream": true to receive the same status/output/complete/error events as the
+FastAPI app in main.py instead (one SSE frame per event).
+
 Run locally for testing:
   python agentcore_entrypoint.py
 
@@ -15,22 +19,19 @@ Expected payload (JSON):
   "project_id": "todo_app_v1",
   "task": "Create a simple React todo app with add/delete functionality",
   "conversation_history": "...",      # optional
-  "model": "google/gemini-2.5-flash"  # optional
+  "model": "google/gemini-2.5-flash", # optional
+  "budget": {"max_steps": 20, "max_wall_time": 600},  # optional
+  "stream": false                     # optional
 }
 """
 
 import json
 from typing import Any, Dict
 
-from langchain_core.messages import HumanMessage
 from bedrock_agentcore.runtime import BedrockAgentCoreApp
 
-from utils.agent import (
-    State,
-    workflow,
-    ProjectSession,
-    get_agent_result_summary,
-)
+from utils.budget import AgentBudget
+from utils.events import run_project_events
 
 
 app = BedrockAgentCoreApp()
@@ -41,78 +42,89 @@ def _validate_payload(payload: Dict[str, Any]) -> None:
     missing = [k for k in required if k not in payload or payload[k] in (None, "")]
     if missing:
         raise ValueError(f"Missing required fields: {', '.join(missing)}")
+    if payload.get("budget"):
+        # Same limits as the FastAPI request model (positive numbers only)
+        AgentBudget(**payload["budget"])
+
+
+def _project_events(payload: Dict[str, Any]):
+    """Event stream for a validated payload, shared with main.py"""
+    return run_project_events(
+        user_id=payload["user_id"],
+        project_id=payload["project_id"],
+        task=payload["task"],
+        conversation_history=payload.get("conversation_history", ""),
+        model=payload.get("model", "google/gemini-2.5-flash"),
+        budget=payload.get("budget") or {},
+    )
+
+
+async def _collect_result(payload: Dict[str, Any]) -> str:
+    """Run to completion and return the result summary as a JSON string
+
+    The completion event carries every field of get_agent_result_summary's original
+    response (task_summary, files_created, total_files, session_type, sandbox_id,
+    sandbox_url) plus usage, budget and compile check (verifications) details.
+    """
+    async for event in _project_events(payload):
+        if event["type"] == "complete":
+            return json.dumps(event["data"])
+        if event["type"] == "error":
+            raise RuntimeError(event["data"]["message"])
+    raise RuntimeError("Agent finished without a result")
 
 
 @app.entrypoint
-def invoke(payload: Dict[str, Any]):
+async def invoke(payload: Dict[str, Any]):
     """
     AgentCore entrypoint. Receives a payload dict and returns a JSON string
-    summarizing the result. Keeps OpenRouter as the LLM provider.
+    summarizing the result, or an async generator of events (streamed by the
+    runtime) when "stream" is true. Keeps OpenRouter as the LLM provider.
     """
     _validate_payload(payload)
 
-    user_id: str = payload["user_id"]
-    project_id: str = payload["project_id"]
-    task: str = payload["task"]
-    conversation_history: str = payload.get("conversation_history", "")
-    model: str = payload.get("model", "google/gemini-2.5-flash")
-
-    # Reuse existing session discovery/creation
-    sandbox = ProjectSession.find_existing_sandbox(user_id, project_id)
-    if sandbox:
-        session_type = "continuing"
-    else:
-        sandbox, _ = ProjectSession.create_new_sandbox(user_id, project_id)
-        session_type = "new"
-
-    # Build the agent state compatible with the existing workflow
-    initial_state = State(
-        messages=[HumanMessage(content=task)],
-        sandbox=sandbox,
-        sandbox_id=sandbox.sandbox_id,
-        sandbox_url=f"https://{sandbox.get_host(3000)}",
-        files_created={},
-        session_type=session_type,
-        conversation_history=conversation_history,
-        user_id=user_id,
-        project_id=project_id,
-        model=model,
-    )
-
-    # Invoke the existing compiled workflow (non-streaming)
-    final_state = workflow.invoke(initial_state)
-
-    # Summarize using existing helpers; return as JSON string
-    summary = get_agent_result_summary(final_state)
-    return json.dumps(summary)
+    if payload.get("stream", False):
+        return _project_events(payload)
+    return await _collect_result(payload)
 
 
 if __name__ == "__main__":
     # Local/dev server on port 8000 with path compatibility for FastAPI-style routes
     # Exposes both /invocations and /api/agent, plus /ping
+    import inspect
     from fastapi import FastAPI
-    from fastapi.responses import JSONResponse
+    from fastapi.responses import JSONResponse, StreamingResponse
     import uvicorn
 
+    from utils.events import format_sse
+
     server = FastAPI()
 
     @server.get("/ping")
     def ping():
         return {"status": "ok"}
 
-    def _invoke_and_normalize(payload: Dict[str, Any]):
-        result = invoke(payload)
+    async def _invoke_and_normalize(payload: Dict[str, Any]):
+        try:
+            result = await invoke(payload)
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"error": str(e)})
+        if inspect.isasyncgen(result):
+            async def sse():
+                async for event in result:
+                    yield format_sse(event)
+            return StreamingResponse(sse(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
         # invoke returns a JSON string; convert to JSON for FastAPI
         if isinstance(result, str):
             return JSONResponse(content=json.loads(result))
         return JSONResponse(content=result)
 
     @server.post("/invocations")
-    def invocations(payload: Dict[str, Any]):
-        return _invoke_and_normalize(payload)
+    async def invocations(payload: Dict[str, Any]):
+        return await _invoke_and_normalize(payload)
 
     @server.post("/api/agent")
-    def api_agent(payload: Dict[str, Any]):
-        return _invoke_and_normalize(payload)
+    async def api_agent(payload: Dict[str, Any]):
+        return await _invoke_and_normalize(payload)
 
-    uvicorn.run(server, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(server, host="0.0.0.0", port=8000)
@@ -4,23 +4,20 @@ Vercel Function for Multi-Session Code Generation Agent
 Provides REST endpoints for project management and code generation
 """
 
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any, AsyncGenerator
 import asyncio
-import json
+from contextlib import asynccontextmanager
 from datetime import datetime
-from langchain_core.messages import HumanMessage
-
-from utils.agent import (
-    State, 
-    workflow,
-    ProjectSession,
-    get_agent_result_summary,
-    stream_agent_execution
-)
+
+from utils.budget import AgentBudget
+from utils.agent import llm_transport
+from utils.events import run_project_events, format_sse
+from utils.jobs import JobManager
+from utils.memory import MEMORY_PROFILING, start_profiling, memory_report
 
 # ========================
 # PYDANTIC MODELS
@@ -34,6 +31,8 @@ class ProjectRequest(BaseModel):
     conversation_history: Optional[str] = None
     # Optional: Model to use (defaults to google/gemini-2.5-flash)
     model: Optional[str] = "google/gemini-2.5-flash"
+    # Optional: Per-request step/token/time limits (server defaults otherwise)
+    budget: Optional[AgentBudget] = None
 
 class ProjectResponse(BaseModel):
     success: bool
@@ -46,19 +45,29 @@ class ProjectResponse(BaseModel):
     files_created: Optional[Dict[str, str]] = None  # File path -> file content
     task_summary: Optional[str] = None
 
-class StreamResponse(BaseModel):
-    type: str  # "status", "output", "error", "complete"
-    data: Dict[str, Any]
-    timestamp: str
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
 
 # ========================
 # FASTAPI APP
 # ========================
 
+# Background builds that outlive the HTTP connection that started them
+job_manager = JobManager(run_project_events)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_profiling()
+    await job_manager.start()
+    yield
+    await job_manager.stop()
+
 app = FastAPI(
     title="Multi-Session Code Generation Agent",
     description="REST API for persistent project development with E2B sandbox",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware for frontend integration
@@ -87,10 +96,26 @@ async def health_check():
         "timestamp": datetime.now().isoformat(),
         "endpoints": {
             "health": "GET /api/agent",
-            "project": "POST /api/agent"
+            "metrics": "GET /api/agent/metrics",
+            "project": "POST /api/agent",
+            "submit_job": "POST /api/jobs",
+            "job_status": "GET /api/jobs/{job_id}",
+            "job_events": "GET /api/jobs/{job_id}/events?after=0"
         }
     }
 
+@app.get("/api/agent/metrics")
+async def llm_metrics():
+    """LLM transport metrics: retry/hedge/fallback counters, tail latencies and circuit states"""
+    return llm_transport.metrics()
+
+@app.get("/api/debug/memory")
+async def memory_debug(top: int = 15):
+    """Per-run state footprints and top allocation sites (only when MEMORY_PROFILING=true)"""
+    if not MEMORY_PROFILING:
+        raise HTTPException(status_code=404, detail="Memory profiling is disabled")
+    return await asyncio.to_thread(memory_report, top)
+
 @app.post("/api/agent")
 async def handle_project(request: ProjectRequest):
     """Handle both new and continuing projects with real-time streaming"""
@@ -100,67 +125,55 @@ async def stream_project_execution(request: ProjectRequest):
     """Stream project execution in real-time"""
     
     async def generate_stream() -> AsyncGenerator[str, None]:
-        try:
-            # Determine if this is a new or continuing project
-            sandbox = ProjectSession.find_existing_sandbox(request.user_id, request.project_id)
-            
-            if sandbox:
-                # Continuing existing project
-                yield f"data: {json.dumps(StreamResponse(type='status', data={'message': f'🎯 Great! I found your existing project. Let me add the new features you requested...'}, timestamp=datetime.now().isoformat()).dict())}\n\n"
-                session_type = "continuing"
-                conversation_history = request.conversation_history or ""
-            else:
-                # Creating new project
-                yield f"data: {json.dumps(StreamResponse(type='status', data={'message': f'✨ Perfect! I\'m creating a brand new project for you...'}, timestamp=datetime.now().isoformat()).dict())}\n\n"
-                sandbox, project_id = ProjectSession.create_new_sandbox(request.user_id, request.project_id)
-                session_type = "new"
-                conversation_history = ""
-            
-            yield f"data: {json.dumps(StreamResponse(type='status', data={'message': '⚙️ Setting up the development environment...'}, timestamp=datetime.now().isoformat()).dict())}\n\n"
-            
-            # Initialize state
-            initial_state = State(
-                messages=[HumanMessage(content=request.task)],
-                sandbox=sandbox,
-                sandbox_id=sandbox.sandbox_id,
-                sandbox_url=f"https://{sandbox.get_host(3000)}",
-                files_created={},
-                session_type=session_type,
-                conversation_history=conversation_history,
-                user_id=request.user_id,
-                project_id=request.project_id,
-                model=request.model
-            )
-            
-            yield f"data: {json.dumps(StreamResponse(type='status', data={'message': '🎨 Now I\'ll start building your app...'}, timestamp=datetime.now().isoformat()).dict())}\n\n"
-            
-            # Create a list to collect messages
-            stream_messages = []
-            
-            # Define stream callback to collect messages
-            def stream_callback(message: str):
-                """Callback to collect messages for streaming"""
-                stream_messages.append(message)
-            
-            # Run the streaming agent
-            final_state = await stream_agent_execution(initial_state, stream_callback)
-            
-            # Stream all collected messages
-            for message in stream_messages:
-                yield f"data: {json.dumps(StreamResponse(type='output', data={'message': message}, timestamp=datetime.now().isoformat()).dict())}\n\n"
-            
-            # Extract results using new helper function
-            summary = get_agent_result_summary(final_state)
-            
-            # Send completion with user-friendly message
-            yield f"data: {json.dumps(StreamResponse(type='complete', data={
-                'sandbox_url': final_state['sandbox_url'],
-                'files_created': final_state['files_created'],  # Include both file paths and content
-                'task_summary': summary['task_summary']
-            }, timestamp=datetime.now().isoformat()).dict())}\n\n"
-            
-        except Exception as e:
-            yield f"data: {json.dumps(StreamResponse(type='error', data={'message': f'😅 Sorry, I encountered an issue while building your app: {str(e)}'}, timestamp=datetime.now().isoformat()).dict())}\n\n"
+        async for event in run_project_events(
+            user_id=request.user_id,
+            project_id=request.project_id,
+            task=request.task,
+            conversation_history=request.conversation_history,
+            model=request.model,
+            budget=request.budget.dict(exclude_none=True) if request.budget else None
+        ):
+            yield format_sse(event)
+    
+    return StreamingResponse(
+        generate_stream(),
+        media_type="text/plain",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "Content-Type": "text/event-stream"
+        }
+    )
+
+@app.post("/api/jobs", response_model=JobResponse)
+async def submit_job(request: ProjectRequest):
+    """Queue a build in the background and return its job id immediately"""
+    payload = request.dict()
+    payload["budget"] = request.budget.dict(exclude_none=True) if request.budget else None
+    job_id = await job_manager.submit(payload)
+    return JobResponse(job_id=job_id, status="queued")
+
+@app.get("/api/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Current status of a background build"""
+    job = await job_manager.status(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str, after: int = 0, last_event_id: Optional[int] = Header(default=None)):
+    """Attach to a background build's event log; disconnecting does not stop the build"""
+    job = await job_manager.status(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    # Browsers resend the last seen id when an EventSource reconnects
+    start_after = max(after, last_event_id or 0)
+    
+    async def generate_stream() -> AsyncGenerator[str, None]:
+        async for seq, event in job_manager.follow(job_id, start_after):
+            yield format_sse(event, event_id=seq)
     
     return StreamingResponse(
         generate_stream(),
@@ -235,4 +248,15 @@ All requests provide real-time streaming updates including:
 - Status messages about app building progress
 - Real-time updates as the AI builds your app
 - Final completion with your app ready to use
+
+BACKGROUND JOBS (survive closed tabs and proxy timeouts):
+POST /api/jobs          (same body as POST /api/agent) -> {"job_id": "...", "status": "queued"}
+GET  /api/jobs/{job_id} -> {"status": "queued|running|completed|failed", "events": 12, ...}
+GET  /api/jobs/{job_id}/events?after=0 -> the same event stream, replayed from the job's log;
+     reconnect with ?after=<last id> (or Last-Event-ID) to resume where you left off
+
+MEMORY DEBUGGING (set MEMORY_PROFILING=true):
+GET /api/debug/memory?top=15 -> {"runs": {...per-run footprints...}, "current_bytes": ..., "top_allocations": [...]}
+Each run keeps at most RUN_HISTORY_MAX_BYTES of file bodies in its message history and
+RUN_FILES_MAX_BYTES in files_created; older bodies are spilled to the snapshot store.
 """ 
\ No newline at end of file
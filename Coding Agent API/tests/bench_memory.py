@@ -0,0 +1,139 @@
+"""Memory benchmark: many concurrent builds against a scripted mock LLM
+
+Each run reads 4 files, then writes 6 turns of 4 x 12KB files before completing, with
+fake in-memory sandboxes. Reports wall time and the tracemalloc peak across all runs,
+and checks every run returns the full content of every file it wrote (including spilled
+ones).
+
+    python tests/bench_memory.py            # 50 concurrent runs
+    RUNS=10 python tests/bench_memory.py
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import tempfile
+import tracemalloc
+import multiprocessing
+
+RUNS = int(os.getenv("RUNS", "50"))
+READ_FILES, FILES_PER_TURN, FILE_BYTES, WRITE_TURNS = 4, 4, 12000, 6
+LLM_LATENCY = 0.2
+
+STATE_DIR = tempfile.mkdtemp(prefix="bench_memory_")
+# Configuration is read at import time, so it is set before the app modules load
+os.environ.update(
+    OPENROUTER_API_KEY="test",
+    MODEL_ROUTING_ENABLED="false",
+    VERIFY_ENABLED="false",
+    COORDINATION_DB_PATH=os.path.join(STATE_DIR, "coordination.sqlite3"),
+    SNAPSHOT_DIR=os.path.join(STATE_DIR, "snapshots"),
+)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_llm_server import MockLLMServer
+
+
+def body(turn: int, index: int) -> str:
+    line = f"export const value_{turn}_{index} = 'lorem ipsum dolor sit amet consectetur';\n"
+    return (line * (FILE_BYTES // len(line) + 1))[:FILE_BYTES]
+
+
+def respond(request):
+    """One read turn, WRITE_TURNS write turns, then task_complete"""
+    time.sleep(LLM_LATENCY)
+    turn = sum(1 for message in request["messages"] if message["role"] == "assistant")
+    if turn == 0:
+        name, args = "read_files", {"file_paths": [f"app/f{i}.tsx" for i in range(READ_FILES)]}
+    elif turn <= WRITE_TURNS:
+        name, args = "create_or_update_files", {"files": [
+            {"path": f"components/T{turn}F{i}.tsx", "content": body(turn, i)} for i in range(FILES_PER_TURN)
+        ]}
+    else:
+        name, args = "task_complete", {"summary": "done", "files_created": []}
+    return {"role": "assistant", "content": None, "tool_calls": [
+        {"id": f"call_{turn}", "type": "function", "function": {"name": name, "arguments": json.dumps(args)}}
+    ]}
+
+
+def serve(port_queue):
+    """Run the mock LLM in its own process so its allocations stay out of the trace"""
+    with MockLLMServer(respond=respond) as server:
+        port_queue.put(server.url)
+        while True:
+            time.sleep(3600)
+
+
+class FakeFiles:
+    def __init__(self):
+        self.store = {}
+
+    def write(self, path, content=None):
+        self.store[path] = content
+
+    def read(self, path):
+        return self.store.get(path, "import React from 'react';\n" * 460)
+
+
+class FakeSandbox:
+    def __init__(self, number):
+        self.sandbox_id = f"sandbox{number}"
+        self.files = FakeFiles()
+
+    def get_host(self, port):
+        return f"{port}-{self.sandbox_id}.e2b.app"
+
+
+async def run(events, number):
+    async for event in events.run_project_events(f"user{number}", "project", "build", budget={"max_steps": 10}):
+        if event["type"] == "error":
+            raise RuntimeError(event["data"])
+        if event["type"] == "complete":
+            files = event["data"]["files_created"]
+            expected = {f"components/T{turn}F{i}.tsx": body(turn, i) for turn in range(1, WRITE_TURNS + 1) for i in range(FILES_PER_TURN)}
+            assert {path: files.get(path) for path in expected} == expected, "file content mismatch"
+            return len(files)
+
+
+async def bench(events):
+    await run(events, -1)  # Warm up imports and connection pools
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    results = await asyncio.gather(*(run(events, number) for number in range(RUNS)))
+    wall = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    print(
+        f"runs={RUNS} files/run={results[0]} wall={wall:.2f}s "
+        f"peak={(peak - baseline) / 2**20:.1f}MiB per_run={(peak - baseline) / RUNS / 2**10:.0f}KiB "
+        f"retained_after={(current - baseline) / 2**20:.1f}MiB"
+    )
+
+
+def main():
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(port_queue,), daemon=True)
+    server.start()
+    try:
+        os.environ["OPENROUTER_BASE_URL"] = port_queue.get(timeout=10)
+        from utils import agent, events
+
+        sandbox_numbers = iter(range(10**6))
+        agent.ProjectSession.find_existing_sandbox = staticmethod(lambda user_id, project_id: None)
+        agent.ProjectSession.rehydrate_sandbox = staticmethod(lambda user_id, project_id: None)
+        agent.ProjectSession.create_new_sandbox = staticmethod(
+            lambda user_id, project_id: (FakeSandbox(next(sandbox_numbers)), project_id)
+        )
+        asyncio.run(bench(events))
+    finally:
+        server.terminate()
+        shutil.rmtree(STATE_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Local OpenAI-compatible chat completions server with scripted faults
+
+Each model has a queue of actions consumed one per request (the last one repeats):
+    "ok"           respond immediately
+    "slow:<secs>"  respond after a delay
+    "500" / "429"  fail with that status code
+
+A respond callable (request body -> assistant message) replaces the default text reply,
+e.g. to script tool calls.
+
+    with MockLLMServer() as server:
+        server.script("main/model", ["500", "ok"])
+        ChatOpenAI(model="main/model", base_url=server.url, api_key="test", max_retries=0)
+"""
+
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Any, Callable, Dict, List, Optional
+
+
+class MockLLMServer:
+    def __init__(self, default_action: str = "ok", respond: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None):
+        self.default_action = default_action
+        self.respond = respond
+        self.requests: List[str] = []  # Model of every request received
+        self._scripts: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def script(self, model: str, actions: List[str]) -> None:
+        with self._lock:
+            self._scripts[model] = list(actions)
+
+    def _next_action(self, model: str) -> str:
+        with self._lock:
+            self.requests.append(model)
+            actions = self._scripts.get(model)
+            if not actions:
+                return self.default_action
+            return actions.pop(0) if len(actions) > 1 else actions[0]
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def __enter__(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                action = mock._next_action(body["model"])
+                if action.startswith("slow:"):
+                    time.sleep(float(action.split(":", 1)[1]))
+                    action = "ok"
+                if action == "ok":
+                    if mock.respond:
+                        message = mock.respond(body)
+                    else:
+                        message = {"role": "assistant", "content": f"reply from {body['model']}"}
+                    status, payload = 200, {
+                        "id": "mock",
+                        "object": "chat.completion",
+                        "created": 0,
+                        "model": body["model"],
+                        "choices": [{
+                            "index": 0,
+                            "finish_reason": "tool_calls" if message.get("tool_calls") else "stop",
+                            "message": message,
+                        }],
+                        "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+                    }
+                else:
+                    status, payload = int(action), {"error": {"message": f"injected {action}", "type": "mock"}}
+                data = json.dumps(payload).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # The client gave up on a slow response
+
+        ThreadingHTTPServer.daemon_threads = True
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.request_queue_size = 256
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,169 @@
+import os
+import time
+import uuid
+import threading
+import multiprocessing
+
+import pytest
+
+from utils.coordination import (
+    CoordinationBackend,
+    SQLiteCoordination,
+    RedisCoordination,
+    ProjectLease,
+    ProjectBusyError,
+    LeaseLostError,
+)
+
+PROCESSES = 8
+SECTIONS_PER_PROCESS = 20
+
+
+@pytest.fixture(scope="module")
+def redis_url():
+    """TEST_REDIS_URL if set, else an in-process Redis-compatible fake server; skipped without either"""
+    pytest.importorskip("redis")
+    url = os.getenv("TEST_REDIS_URL")
+    if url:
+        yield url
+        return
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")  # Lease renew/release are Lua scripts
+    server = fakeredis.TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    yield f"redis://{host}:{port}/0"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def backend_spec(request, tmp_path):
+    """Picklable description of a backend, so worker processes can open their own"""
+    if request.param == "sqlite":
+        path = str(tmp_path / "coordination.sqlite3")
+        SQLiteCoordination(path)  # Create the schema before the workers race for it
+        return ("sqlite", path)
+    return ("redis", request.getfixturevalue("redis_url"), f"test-{uuid.uuid4().hex[:8]}:")
+
+
+def open_backend(spec) -> CoordinationBackend:
+    if spec[0] == "sqlite":
+        return SQLiteCoordination(spec[1])
+    return RedisCoordination(spec[1], prefix=spec[2])
+
+
+def _lease_worker(spec, log_path: str, sections: int) -> None:
+    """Repeatedly take the project lease and log entry/exit of the critical section"""
+    backend = open_backend(spec)
+    done = 0
+    while done < sections:
+        lease = ProjectLease("user", "project", ttl=5, backend=backend)
+        try:
+            lease.acquire(wait=30)
+        except ProjectBusyError:
+            continue
+        try:
+            with open(log_path, "a") as f:
+                f.write(f"start {os.getpid()}\n")
+            time.sleep(0.005)
+            with open(log_path, "a") as f:
+                f.write(f"end {os.getpid()}\n")
+        finally:
+            lease.release()
+        done += 1
+
+
+def test_lease_is_exclusive_across_processes(backend_spec, tmp_path):
+    log_path = str(tmp_path / "sections.log")
+    processes = [
+        multiprocessing.Process(target=_lease_worker, args=(backend_spec, log_path, SECTIONS_PER_PROCESS))
+        for _ in range(PROCESSES)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=120)
+        assert process.exitcode == 0
+
+    holder, overlaps, sections = None, 0, 0
+    with open(log_path) as f:
+        for line in f:
+            kind, pid = line.split()
+            if kind == "start":
+                overlaps += holder is not None
+                holder = pid
+                sections += 1
+            else:
+                overlaps += holder != pid
+                holder = None
+    assert sections == PROCESSES * SECTIONS_PER_PROCESS
+    assert overlaps == 0
+
+
+class FlakyBackend(SQLiteCoordination):
+    """Fails the next renew_failures renewals with an exception"""
+
+    def __init__(self, path, renew_failures):
+        super().__init__(path)
+        self.renew_failures = renew_failures
+
+    def renew_lease(self, key, owner, ttl):
+        if self.renew_failures:
+            self.renew_failures -= 1
+            raise RuntimeError("database is locked")
+        return super().renew_lease(key, owner, ttl)
+
+
+def test_lease_survives_transient_renewal_errors(tmp_path):
+    lease = ProjectLease("user", "project", ttl=1.5, backend=FlakyBackend(str(tmp_path / "c.sqlite3"), renew_failures=2))
+    lease.acquire(wait=0)
+    time.sleep(2.5)
+    assert not lease.lost
+    lease.check()
+    lease.release()
+
+
+def test_lease_reports_loss_when_renewal_keeps_failing(tmp_path):
+    lease = ProjectLease("user", "project", ttl=1, backend=FlakyBackend(str(tmp_path / "c.sqlite3"), renew_failures=1000))
+    lease.acquire(wait=0)
+    time.sleep(2)
+    assert lease.lost
+    with pytest.raises(LeaseLostError):
+        lease.check()
+    lease.release()
+
+
+def test_backend_contract(backend_spec):
+    backend = open_backend(backend_spec)
+    assert backend.acquire_lease("key", "a", ttl=5)
+    assert backend.acquire_lease("key", "a", ttl=5)  # Re-entrant for the owner
+    assert not backend.acquire_lease("key", "b", ttl=5)
+    assert not backend.renew_lease("key", "b", ttl=5)
+    backend.release_lease("key", "b")  # Only the owner can release
+    assert not backend.acquire_lease("key", "b", ttl=5)
+    backend.release_lease("key", "a")
+    assert backend.acquire_lease("key", "b", ttl=5)
+
+    backend.registry_set("record", {"value": 1}, ttl=0.3)
+    assert backend.registry_get("record") == {"value": 1}
+    time.sleep(0.4)
+    assert backend.registry_get("record") is None
+
+    first = backend.publish("channel", {"n": 1})
+    backend.publish("channel", {"n": 2})
+    assert [message for _, message in backend.read("channel")] == [{"n": 1}, {"n": 2}]
+    assert [message for _, message in backend.read("channel", after=first)] == [{"n": 2}]
+
+
+def test_incomplete_backend_fails_when_created():
+    class NoMessages(CoordinationBackend):
+        def acquire_lease(self, key, owner, ttl): return True
+        def renew_lease(self, key, owner, ttl): return True
+        def release_lease(self, key, owner): pass
+        def registry_set(self, key, value, ttl=None): pass
+        def registry_get(self, key): return None
+        def registry_delete(self, key): pass
+
+    with pytest.raises(TypeError):
+        NoMessages()
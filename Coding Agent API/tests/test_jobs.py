@@ -0,0 +1,138 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from utils import jobs
+from utils.jobs import JobStore, JobManager, QUEUED, RUNNING, COMPLETED
+from utils.coordination import SQLiteCoordination
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "jobs.sqlite3")
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return SQLiteCoordination(str(tmp_path / "coordination.sqlite3"))
+
+
+def event(event_type, **data):
+    return {"type": event_type, "data": data}
+
+
+def test_claim_next_takes_the_oldest_job_once(db_path):
+    store = JobStore(db_path)
+    first = store.submit({"task": "first"})
+    second = store.submit({"task": "second"})
+    assert store.claim_next() == (first, {"task": "first"})
+    assert store.claim_next() == (second, {"task": "second"})
+    assert store.claim_next() is None
+    assert store.get(first)["status"] == RUNNING
+
+
+def test_concurrent_claims_never_share_a_job(db_path):
+    job_ids = [JobStore(db_path).submit({"n": i}) for i in range(200)]
+    claims, lock = [], threading.Lock()
+
+    def claim_all():
+        store = JobStore(db_path)  # A store per thread, like separate worker processes
+        while (claimed := store.claim_next()) is not None:
+            with lock:
+                claims.append(claimed[0])
+
+    threads = [threading.Thread(target=claim_all) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claims) == sorted(job_ids)
+
+
+def test_requeue_stale_leaves_heartbeating_jobs_alone(db_path):
+    live, dead = JobStore(db_path), JobStore(db_path)
+    live_job = live.submit({})
+    dead_job = live.submit({})
+    live.claim_next()
+    dead.claim_next()
+    dead.append_event(dead_job, event("status", message="started"))
+
+    time.sleep(0.2)
+    live.heartbeat([live_job])
+    dead.heartbeat([live_job])  # Another worker's job is not its to keep alive
+    assert live.requeue_stale(stale_after=0.1) == 1
+
+    assert live.get(live_job)["status"] == RUNNING
+    assert live.get(dead_job)["status"] == QUEUED
+    assert live.events_after(dead_job) == []  # A replayed job starts a fresh event log
+    assert live.claim_next()[0] == dead_job
+
+
+def test_stale_jobs_outlive_the_project_lease():
+    assert jobs.JOB_STALE_AFTER >= jobs.PROJECT_LEASE_TTL
+
+
+def test_retry_later_delays_and_backs_off(db_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_BUSY_RETRY_DELAY", 0.1)
+    store = JobStore(db_path)
+    job_id = store.submit({})
+    store.claim_next()
+    assert store.retry_later(job_id) == pytest.approx(0.1)
+    assert store.claim_next() is None
+    time.sleep(0.15)
+    assert store.claim_next()[0] == job_id
+    assert store.retry_later(job_id) == pytest.approx(0.2)
+
+
+def test_follow_replays_after_a_sequence_number(db_path, backend):
+    async def run_job(**payload):
+        for i in range(3):
+            yield event("output", message=f"step {i}")
+            await asyncio.sleep(0.01)
+        yield event("complete", result="done")
+
+    async def scenario():
+        manager = JobManager(run_job, store=JobStore(db_path), workers=1, backend=backend)
+        await manager.start()
+        try:
+            job_id = await manager.submit({})
+            seen = [seq async for seq, _ in manager.follow(job_id)]
+            resumed = [(seq, item["type"]) async for seq, item in manager.follow(job_id, after=2)]
+            return seen, resumed, await manager.status(job_id)
+        finally:
+            await manager.stop()
+
+    seen, resumed, status = asyncio.run(scenario())
+    assert seen == [1, 2, 3, 4]
+    assert resumed == [(3, "output"), (4, "complete")]
+    assert status["status"] == COMPLETED
+
+
+def test_busy_project_is_retried_not_failed(db_path, backend, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_BUSY_RETRY_DELAY", 0.05)
+    monkeypatch.setattr(jobs, "JOB_POLL_INTERVAL", 0.05)
+    attempts = []
+
+    async def run_job(**payload):
+        attempts.append(time.monotonic())
+        if len(attempts) < 3:
+            yield event("error", message="busy", project_busy=True)
+            return
+        yield event("complete", result="done")
+
+    async def scenario():
+        manager = JobManager(run_job, store=JobStore(db_path), workers=1, backend=backend)
+        await manager.start()
+        try:
+            job_id = await manager.submit({})
+            events = [item async for _, item in manager.follow(job_id)]
+            return events, await manager.status(job_id)
+        finally:
+            await manager.stop()
+
+    events, status = asyncio.run(scenario())
+    assert len(attempts) == 3
+    assert [item["type"] for item in events] == ["complete"]  # Busy attempts leave no events behind
+    assert status["status"] == COMPLETED
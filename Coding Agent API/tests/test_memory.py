@@ -0,0 +1,35 @@
+import pytest
+
+from utils import memory
+from utils.memory import SpilledFile, merge_files, spill_files, materialize_files
+from utils.snapshot import SnapshotStore
+
+BODY = 2000  # Bytes per file, above SPILL_MIN_FILE_BYTES
+
+
+@pytest.fixture(autouse=True)
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory, "snapshot_store", SnapshotStore(str(tmp_path)))
+
+
+def write(files, *paths, body="x"):
+    return merge_files(files, {path: body * BODY for path in paths})
+
+
+def test_rewritten_files_move_to_the_end():
+    files = write({}, "a.tsx", "b.tsx", "c.tsx")
+    files = write(files, "a.tsx", body="y")
+    assert list(files) == ["b.tsx", "c.tsx", "a.tsx"]
+
+
+def test_spills_least_recently_written_first():
+    files = write({}, "a.tsx", "b.tsx", "c.tsx")
+    files = write(files, "a.tsx", body="y")
+    spilled = spill_files(files, limit=2 * BODY)
+    assert list(spilled) == ["b.tsx"]
+
+    # Replacing a body with its spilled copy does not count as a write
+    files = merge_files(files, spilled)
+    assert list(files) == ["b.tsx", "c.tsx", "a.tsx"]
+    assert isinstance(files["b.tsx"], SpilledFile)
+    assert materialize_files(files) == {"b.tsx": "x" * BODY, "c.tsx": "x" * BODY, "a.tsx": "y" * BODY}
@@ -0,0 +1,60 @@
+from langchain_core.messages import AIMessage, HumanMessage
+
+from utils import agent
+from utils.project_index import update_index, describe_changes, task_with_index
+
+INDEX = {
+    "files": {
+        "app/page.tsx": {"size": 120, "exports": ["Page"], "imports": ["components/Header.tsx"]},
+        "components/Header.tsx": {"size": 80, "exports": ["Header"], "imports": []},
+    },
+    "packages": ["react"],
+}
+
+
+def test_describe_changes_reports_files_and_packages():
+    after = update_index(INDEX, {
+        "components/Footer.tsx": "export function Footer() {}",
+        "components/Header.tsx": "export function Header() {}\nexport const NAV = []",
+        "package.json": '{"dependencies": {"react": "1", "zod": "3"}}',
+    })
+    del after["files"]["app/page.tsx"]
+    assert describe_changes(INDEX, after) == (
+        "Project index changes: added components/Footer.tsx (exports: Footer), package.json; "
+        "exports changed in components/Header.tsx (exports: Header, NAV); "
+        "removed app/page.tsx; installed zod."
+    )
+
+
+def test_describe_changes_ignores_body_only_edits():
+    after = update_index(INDEX, {"components/Header.tsx": "export function Header() { return null }"})
+    assert describe_changes(INDEX, after) == ""
+
+
+def test_task_with_index():
+    assert task_with_index("Add a footer", None) == "Add a footer"
+    message = task_with_index("Add a footer", INDEX)
+    assert message.startswith("<project_index>\nFiles")
+    assert message.endswith("</project_index>\n\nAdd a footer")
+
+
+def test_system_prompt_is_stable_while_the_index_changes(monkeypatch):
+    prompts = []
+
+    def fake_routed_invoke(state, messages, invoke_step):
+        prompts.append(messages[0]["content"])
+        return AIMessage(content="", tool_calls=[{"name": "task_complete", "args": {}, "id": "call"}]), []
+
+    monkeypatch.setattr(agent, "routed_invoke", fake_routed_invoke)
+    state = {
+        "messages": [HumanMessage(content=task_with_index("Add a footer", INDEX))],
+        "session_type": "continuing",
+        "conversation_history": "Built a landing page",
+        "budget": {},
+        "steps": 0,
+        "project_index": INDEX,
+    }
+    agent.llm_call(state)
+    agent.llm_call({**state, "steps": 1, "project_index": update_index(INDEX, {"components/Footer.tsx": "export function Footer() {}"})})
+    assert len(prompts) == 2 and prompts[0] == prompts[1]
+    assert "components/Header.tsx" not in prompts[0]
@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+from utils.snapshot import SnapshotStore
+from utils.agent import may_change_files
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SnapshotStore(str(tmp_path), keep_versions=3)
+
+
+def blob_count(store):
+    return sum(len(names) for _, _, names in os.walk(os.path.join(store.root, "blobs")))
+
+
+def versions(store, user_id="user", project_id="project"):
+    return sorted(int(name.split(".")[0]) for name in os.listdir(os.path.join(store._project_dir(user_id, project_id), "versions")))
+
+
+def test_round_trip(store):
+    files = {"app/page.tsx": "export default function Page() {}\n", "package.json": "{}"}
+    store.save("user", "project", files)
+    manifest = store.latest("user", "project")
+    assert manifest["version"] == 1
+    assert store.load_files(manifest) == files
+    assert store.latest("user", "other") is None
+
+
+def test_identical_bodies_share_one_blob(store):
+    store.save("user", "project", {"a.tsx": "same", "b.tsx": "same"})
+    store.save("user", "other", {"c.tsx": "same"})
+    assert blob_count(store) == 1
+
+
+def test_unchanged_save_does_not_create_a_version(store):
+    store.save("user", "project", {"a.tsx": "one"})
+    assert store.save("user", "project", {"a.tsx": "one"})["version"] == 1
+    assert store.save("user", "project", {}, deleted=["missing.tsx"])["version"] == 1
+    assert versions(store) == [1]
+
+
+def test_deleted_paths_leave_the_snapshot(store):
+    store.save("user", "project", {"a.tsx": "one", "b.tsx": "two"})
+    manifest = store.save("user", "project", {"c.tsx": "three"}, deleted=["a.tsx"])
+    assert store.load_files(manifest) == {"b.tsx": "two", "c.tsx": "three"}
+
+
+def test_keeps_only_the_last_versions(store):
+    for i in range(6):
+        store.save("user", "project", {"a.tsx": str(i)})
+    assert versions(store) == [4, 5, 6]
+    assert store.load_files(store.latest("user", "project")) == {"a.tsx": "5"}
+
+
+@pytest.mark.parametrize("command, changes", [
+    ("ls -la app", False),
+    ("cat app/page.tsx | grep export", False),
+    ("cd app && find . -name '*.tsx' 2>/dev/null", False),
+    ("npm install zod", True),
+    ("rm components/Old.tsx", True),
+    ("mv a.tsx b.tsx", True),
+    ("echo 'x' > notes.md", True),
+    ("find . -name '*.bak' -delete", True),
+])
+def test_may_change_files(command, changes):
+    assert may_change_files(command) is changes
@@ -0,0 +1,107 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from langchain_openai import ChatOpenAI
+
+from utils import transport
+from utils.transport import LLMTransport, CircuitBreaker, CircuitOpenError, DeadlineExceededError
+from mock_llm_server import MockLLMServer
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+@pytest.fixture
+def server():
+    with MockLLMServer() as server:
+        yield server
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(transport, "LLM_RETRY_BASE_DELAY", 0.01)
+
+
+def make_transport(server, **kwargs):
+    def build_llm(model, timeout):
+        return ChatOpenAI(model=model, base_url=server.url, api_key="test", timeout=timeout, max_retries=0)
+    kwargs.setdefault("fallback_models", [])
+    return LLMTransport(build_llm, **kwargs)
+
+
+def test_retries_transient_errors(server):
+    server.script("main", ["500", "429", "ok"])
+    llm = make_transport(server)
+    assert llm.invoke("main", MESSAGES).content == "reply from main"
+    assert llm.counters["retries"] == 2
+    assert llm.breaker("main").state == CircuitBreaker.CLOSED
+
+
+def test_falls_back_when_model_keeps_failing(server):
+    server.script("main", ["500"])
+    llm = make_transport(server, fallback_models=["backup"], max_retries=1)
+    assert llm.invoke("main", MESSAGES).content == "reply from backup"
+    assert llm.counters["fallbacks"] == 1
+
+
+def test_circuit_opens_and_skips_model(server):
+    server.script("main", ["500"])
+    llm = make_transport(server, max_retries=0)
+    for _ in range(transport.CIRCUIT_FAILURE_THRESHOLD):
+        with pytest.raises(Exception):
+            llm.invoke("main", MESSAGES)
+    assert llm.breaker("main").state == CircuitBreaker.OPEN
+    requests = len(server.requests)
+    with pytest.raises(CircuitOpenError):
+        llm.invoke("main", MESSAGES)
+    assert len(server.requests) == requests  # Open circuit: the model was not called
+
+
+def test_hedge_wins_over_slow_request(server, monkeypatch):
+    monkeypatch.setattr(transport, "LLM_HEDGE_MIN_SAMPLES", 5)
+    llm = make_transport(server, hedge_enabled=True)
+    for _ in range(5):
+        llm.latency.record("main", 0.05)
+    server.script("main", ["slow:2", "ok"])
+    started = time.monotonic()
+    assert llm.invoke("main", MESSAGES).content == "reply from main"
+    assert time.monotonic() - started < 1.5
+    assert llm.counters["hedges"] == 1
+    assert llm.counters["hedge_wins"] == 1
+
+
+def test_caller_deadline_does_not_open_circuit(server):
+    server.script("main", ["slow:1"])
+    llm = make_transport(server)
+    for _ in range(transport.CIRCUIT_FAILURE_THRESHOLD + 1):
+        with pytest.raises(DeadlineExceededError):
+            llm.invoke("main", MESSAGES, deadline=time.monotonic() + 0.2)
+    assert llm.breaker("main").state == CircuitBreaker.CLOSED
+    server.script("main", ["ok"])
+    assert llm.invoke("main", MESSAGES).content == "reply from main"
+
+
+def test_concurrent_calls_are_not_queued():
+    calls = 64
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    class SlowLLM:
+        def invoke(self, messages):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.5)
+            with lock:
+                active[0] -= 1
+            return "ok"
+
+    llm = LLMTransport(lambda model, timeout: SlowLLM(), fallback_models=[], call_timeout=5)
+    with ThreadPoolExecutor(calls) as pool:
+        results = list(pool.map(lambda _: llm.invoke("main", MESSAGES), range(calls)))
+    assert results == ["ok"] * calls
+    # Every call was in flight at once: no pool capped them
+    assert peak[0] == calls
+    # Recorded latency is the request itself, not time spent waiting for a thread
+    assert llm.latency.percentile("main", 100) < 1.0
@@ -0,0 +1,47 @@
+import pytest
+
+from utils.verify import routes_for_files, extract_errors
+
+
+@pytest.mark.parametrize("paths, routes", [
+    (["app/page.tsx"], ["/"]),
+    (["./app/about/page.tsx"], ["/about"]),
+    (["src/app/blog/posts/page.jsx"], ["/blog/posts"]),
+    (["app/(marketing)/pricing/page.tsx"], ["/pricing"]),
+    (["app/blog/[slug]/page.tsx"], ["/"]),
+    (["components/Header.tsx"], ["/"]),
+    (["components/Header.tsx", "app/about/page.tsx"], ["/", "/about"]),
+    # Files that merely end in "page" are not pages
+    (["app/homepage.tsx"], ["/"]),
+    (["app/dashboard/subpage.tsx"], ["/"]),
+])
+def test_routes_for_files(paths, routes):
+    assert routes_for_files(paths) == routes
+
+
+def test_routes_are_capped(monkeypatch):
+    monkeypatch.setattr("utils.verify.VERIFY_MAX_ROUTES", 2)
+    assert routes_for_files(["app/a/page.tsx", "app/b/page.tsx", "app/c/page.tsx"]) == ["/a", "/b"]
+
+
+def test_extract_errors_from_error_page():
+    page = (
+        "<html><body>\n<h1>Failed to compile</h1>\n"
+        "<pre>./app/page.tsx\nModule not found: Can&#x27;t resolve &#x27;@/components/Missing&#x27;</pre>\n"
+        "<p>Some unrelated text</p>\n</body></html>"
+    )
+    assert extract_errors(page) == [
+        "Failed to compile",
+        "Module not found: Can't resolve '@/components/Missing'",
+    ]
+
+
+def test_extract_errors_from_flight_payload():
+    page = '<script>self.__next_f.push([1,"ReferenceError: foo is not defined\\n    at Page"])</script>'
+    assert extract_errors(page) == ["ReferenceError: foo is not defined"]
+
+
+def test_extract_errors_is_capped_and_deduplicated(monkeypatch):
+    monkeypatch.setattr("utils.verify.VERIFY_MAX_ERRORS", 2)
+    page = "\n".join(["Error: same"] * 3 + ["Error: second", "Error: third"])
+    assert extract_errors(page) == ["Error: same", "Error: second"]
@@ -1,24 +1,66 @@
 import os
+import re
 import json
+import shlex
+import posixpath
+import asyncio
 import uuid
 import time
+import operator
+from concurrent.futures import Future
 from datetime import datetime
-from typing import Literal, Dict, Any, List, Optional
+from typing import Literal, Dict, Any, List, Optional, Annotated
 from dotenv import load_dotenv
 from e2b_code_interpreter import Sandbox
 from e2b.sandbox.sandbox_api import SandboxQuery
+from langchain_core.messages import AIMessage
 from langchain_core.tools import tool
 from langchain_core.runnables.config import RunnableConfig
 from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, MessagesState, START, END
 from pydantic import BaseModel, Field
 from .prompt import SYSTEM_PROMPT
+from .snapshot import snapshot_store
+from .coordination import get_backend, project_key
+from .router import routed_invoke, summarize_step_metrics, FAST_TOOLS, ESCALATION_TOOL, TIER_FAST, TIER_PRIMARY
+from .transport import LLMTransport, DeadlineExceededError, OPENROUTER_BASE_URL
+from .threads import start_thread
+from .project_index import update_index, save_index, refresh_index, invalidate_index, describe_changes
+from .verify import VERIFY_ENABLED, check_compile, format_compile_feedback
+from .memory import (
+    merge_files,
+    spill_files,
+    materialize_files,
+    compact_messages,
+    drop_raw_tool_calls,
+    state_footprint,
+    run_memory
+)
+from .budget import (
+    WRAP_UP_PROMPT,
+    WRAP_UP_TIMEOUT,
+    should_wrap_up,
+    remaining_wall_time,
+    budget_report,
+    recursion_limit
+)
 
 load_dotenv()
 
 # Configuration
 TEMPLATE_NAME = "lovable-clone"
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+NPM_INSTALL_TIMEOUT = int(os.getenv("NPM_INSTALL_TIMEOUT", "300"))
+SANDBOX_TIMEOUT = 600  # Seconds a sandbox lives
+PROJECT_ROOT = "/home/user"
+CHANGE_MARKER = "/tmp/.agent-command-marker"  # Touched before commands that may change files
+
+# Commands that only inspect the sandbox; anything else (or any redirect to a file) may change files
+READ_ONLY_COMMANDS = {
+    "ls", "cat", "head", "tail", "grep", "egrep", "rg", "pwd", "echo", "wc", "tree", "stat",
+    "du", "df", "which", "whoami", "env", "printenv", "file", "diff", "sort", "uniq", "cd",
+}
+FILE_REDIRECT = re.compile(r"(?<![0-9&])>(?!&)|[0-9]>(?!&|\s*/dev/null)")
 
 # ========================
 # SANDBOX MANAGEMENT
@@ -28,11 +70,26 @@ class ProjectSession:
     """Manages persistent project sessions across conversations"""
     
     @staticmethod
-    def create_new_sandbox(user_id: str, project_id: str) -> tuple[Sandbox, str]:
-        """Create a new sandbox with metadata for a project"""
-        sandbox = Sandbox(
+    def _registry_key(user_id: str, project_id: str) -> str:
+        return f"sandbox:{user_id}/{project_id}"
+    
+    @staticmethod
+    def register_sandbox(user_id: str, project_id: str, sandbox: Sandbox) -> None:
+        """Record the project's sandbox in the shared registry so every worker finds the same one"""
+        try:
+            get_backend().registry_set(
+                ProjectSession._registry_key(user_id, project_id),
+                {"sandbox_id": sandbox.sandbox_id}
+            )
+        except Exception as e:
+            pass
+    
+    @staticmethod
+    def _boot_sandbox(user_id: str, project_id: str) -> Sandbox:
+        """Start a template sandbox for a project without registering it"""
+        return Sandbox(
             template=TEMPLATE_NAME,
-            timeout= 600,
+            timeout=SANDBOX_TIMEOUT,
             metadata={
                 "user_id": user_id,
                 "project_id": project_id,
@@ -40,12 +97,30 @@ class ProjectSession:
                 "session_type": "new"
             }
         )
-        
+    
+    @staticmethod
+    def create_new_sandbox(user_id: str, project_id: str) -> tuple[Sandbox, str]:
+        """Create a new sandbox with metadata for a project"""
+        sandbox = ProjectSession._boot_sandbox(user_id, project_id)
+        ProjectSession.register_sandbox(user_id, project_id, sandbox)
         return sandbox, project_id
     
     @staticmethod
     def find_existing_sandbox(user_id: str, project_id: str) -> Optional[Sandbox]:
         """Find existing sandbox by user_id and project_id"""
+        # Fast path: the shared registry remembers which sandbox belongs to the project
+        registry_key = ProjectSession._registry_key(user_id, project_id)
+        try:
+            entry = get_backend().registry_get(registry_key)
+            if entry:
+                return Sandbox.connect(entry["sandbox_id"])
+        except Exception as e:
+            # Registered sandbox has expired; fall back to a metadata search
+            try:
+                get_backend().registry_delete(registry_key)
+            except Exception:
+                pass
+        
         try:
             sandboxes = Sandbox.list(
                 query=SandboxQuery(
@@ -59,6 +134,7 @@ class ProjectSession:
             if sandboxes:
                 sandbox_info = sandboxes[0]  # Get the first matching sandbox
                 sandbox = Sandbox.connect(sandbox_info.sandbox_id)
+                ProjectSession.register_sandbox(user_id, project_id, sandbox)
                 return sandbox
             else:
                 return None
@@ -66,22 +142,128 @@ class ProjectSession:
         except Exception as e:
             return None
 
+    @staticmethod
+    def rehydrate_sandbox(user_id: str, project_id: str) -> Optional[Sandbox]:
+        """Restore the latest project snapshot into a fresh sandbox, or None if there is no snapshot or the restore failed"""
+        manifest = snapshot_store.latest(user_id, project_id)
+        if not manifest:
+            return None
+
+        files = snapshot_store.load_files(manifest)
+        sandbox = ProjectSession._boot_sandbox(user_id, project_id)
+
+        try:
+            # Bulk uploads fail for missing directories, so create them all first
+            directories = sorted({posixpath.dirname(path) for path in files} - {""})
+            if directories:
+                sandbox.commands.run(f"cd {PROJECT_ROOT} && mkdir -p {' '.join(shlex.quote(d) for d in directories)}")
+
+            # Restore the whole file tree with a single bulk upload
+            sandbox.files.write([{"path": path, "data": content} for path, content in files.items()])
+
+            # Reinstall any dependencies added on top of the template
+            if "package.json" in files:
+                sandbox.commands.run("npm install --no-audit --no-fund", timeout=NPM_INSTALL_TIMEOUT)
+        except Exception as e:
+            # Never leave a half-restored sandbox where the next request would find it
+            try:
+                sandbox.kill()
+            except Exception:
+                pass
+            try:
+                get_backend().registry_delete(ProjectSession._registry_key(user_id, project_id))
+            except Exception:
+                pass
+            return None
+
+        # Only a fully restored sandbox becomes the project's sandbox
+        ProjectSession.register_sandbox(user_id, project_id, sandbox)
+        return sandbox
+
+def resolve_sandbox(sandbox: Any) -> Sandbox:
+    """Return the sandbox, waiting for it first if it is still being provisioned (a Future)"""
+    return sandbox.result() if isinstance(sandbox, Future) else sandbox
+
+def save_project_snapshot(config: RunnableConfig, files: Dict[str, str], deleted: List[str] = ()) -> None:
+    """Record files (and deleted paths) in the project's snapshot; never fails the calling tool"""
+    try:
+        configurable = config["configurable"]
+        user_id = configurable.get("user_id")
+        project_id = configurable.get("project_id")
+        if user_id and project_id and (files or deleted):
+            snapshot_store.save(user_id, project_id, files, deleted)
+    except Exception as e:
+        pass
+
+def may_change_files(command: str) -> bool:
+    """Whether a terminal command can create, change, move or delete project files"""
+    if FILE_REDIRECT.search(command):
+        return True
+    for segment in re.split(r"&&|\|\||[;|]", command):
+        words = segment.split()
+        if not words:
+            continue
+        if words[0] == "find" and not {"-delete", "-exec", "-execdir"} & set(words):
+            continue
+        if words[0] not in READ_ONLY_COMMANDS:
+            return True
+    return False
+
+def sync_snapshot_after_command(config: RunnableConfig, sandbox: Sandbox) -> None:
+    """Record what a terminal command changed since CHANGE_MARKER was touched
+
+    Tracked paths that no longer exist are dropped from the snapshot, and project files
+    the command created, changed or moved (ctime newer than the marker) are added, so a
+    rehydrated sandbox matches the sandbox that was snapshotted.
+    """
+    try:
+        configurable = config["configurable"]
+        manifest = snapshot_store.latest(configurable.get("user_id"), configurable.get("project_id"))
+        tracked = " ".join(shlex.quote(path) for path in (manifest["files"] if manifest else {}))
+        result = sandbox.commands.run(
+            f"cd {PROJECT_ROOT} && for f in {tracked}; do [ -e \"$f\" ] || echo \"D $f\"; done; "
+            "find . \\( -path ./node_modules -o -path ./.next -o -path ./.git \\) -prune -o "
+            f"-type f -cnewer {CHANGE_MARKER} -printf 'C %P\\n'"
+        )
+        deleted, changed = [], {}
+        for line in (result.stdout or "").splitlines():
+            kind, _, path = line.partition(" ")
+            if kind == "D":
+                deleted.append(path)
+            elif kind == "C":
+                try:
+                    changed[path] = sandbox.files.read(path)
+                except Exception:
+                    pass  # Binary or vanished since the listing
+        save_project_snapshot(config, changed, deleted)
+    except Exception as e:
+        pass
+
 # ========================
 # STATE DEFINITION
 # ========================
 
 class State(MessagesState):
     """State for the code generation agent"""
-    sandbox: Any  # E2B Sandbox instance
-    sandbox_id: str
-    sandbox_url: str
-    files_created: Dict[str, str]
+    sandbox: Any  # E2B Sandbox instance, or a Future while a new sandbox boots
+    sandbox_id: str  # Empty until the sandbox is ready
+    sandbox_url: str  # Empty until the sandbox is ready
+    files_created: Annotated[Dict[str, Any], merge_files]  # Path -> content (or SpilledFile once over RUN_FILES_MAX_BYTES)
     # Session management fields
     session_type: str = "new"  # "new" or "continuing"
     conversation_history: str = ""  # Previous conversation summary
     user_id: str = ""  # User identifier
     project_id: str = ""  # Project identifier
     model: str = "google/gemini-2.5-flash"  # Model to use for LLM calls
+    step_metrics: Annotated[List[Dict[str, Any]], operator.add]  # Per-call latency/token/cost accounting
+    # Budget enforcement fields
+    budget: Dict[str, Any]  # Per-request limits (see utils.budget.AgentBudget)
+    steps: int  # Number of LLM turns taken so far
+    started_at: float  # Run start (time.time())
+    wrapped_up: bool  # Whether the forced wrap-up turn was used
+    verifications: Annotated[List[Dict[str, Any]], operator.add]  # Compile check results and timings
+    project_index: Optional[Dict[str, Any]]  # File tree, exports/imports and packages (continuing sessions)
+    lease: Any  # ProjectLease held for the run (None when run outside run_project_events)
 
 # ========================
 # PYDANTIC MODELS FOR TOOL SCHEMAS
@@ -104,6 +286,10 @@ class ReadFilesInput(BaseModel):
     """Schema for read_files tool input"""  
     file_paths: List[str] = Field(description="List of file paths to read")
 
+class EscalateInput(BaseModel):
+    """Schema for escalate_to_primary tool input"""
+    reason: str = Field(description="What the next step needs to do, e.g. write or fix files")
+
 class TaskComplete(BaseModel):
     """Schema for task_complete tool input"""
     summary: str = Field(description="Summary of what was accomplished")
@@ -113,6 +299,14 @@ class TaskComplete(BaseModel):
 # TOOL DEFINITIONS
 # ========================
 
+def notify(config: RunnableConfig, message: str) -> None:
+    """Send a user-facing progress message to the run's stream callback (or stdout without one)"""
+    stream_callback = config.get("configurable", {}).get("stream_callback")
+    if stream_callback:
+        stream_callback(message)
+    else:
+        print(message)
+
 @tool(args_schema=TerminalInput)
 def terminal(command: str, config: RunnableConfig) -> str:
     """Use the terminal to run commands in the sandbox."""
@@ -121,12 +315,21 @@ def terminal(command: str, config: RunnableConfig) -> str:
         
         # Send user-friendly message via stream callback (if available)
         if "npm install" in command:
-            print(f"📦 Installing the necessary packages for your app...")
+            notify(config, f"📦 Installing the necessary packages for your app...")
         else:
-            print(f"⚙️ Running some setup commands for your app...")
+            notify(config, f"⚙️ Running some setup commands for your app...")
+        
+        changes_files = may_change_files(command)
+        if changes_files:
+            sandbox.commands.run(f"touch {CHANGE_MARKER}")
         
         # Actually run the command and return the output for the LLM
-        result = sandbox.commands.run(command)
+        try:
+            result = sandbox.commands.run(command)
+        finally:
+            # Keep the snapshot in step with files the command added, changed or removed
+            if changes_files:
+                sync_snapshot_after_command(config, sandbox)
         output = result.stdout if result.stdout else ""
         if result.stderr:
             output += f"\nSTDERR: {result.stderr}"
@@ -135,7 +338,7 @@ def terminal(command: str, config: RunnableConfig) -> str:
             
     except Exception as e:
         error_msg = f"Command failed: {e}"
-        print(f"😅 Sorry, I had trouble running some setup commands: {e}")
+        notify(config, f"😅 Sorry, I had trouble running some setup commands: {e}")
         return error_msg
 
 @tool(args_schema=CreateFilesInput)
@@ -155,6 +358,8 @@ def create_or_update_files(files: List[FileToCreate], config: RunnableConfig) ->
             except Exception as verify_error:
                 results.append(f"Created {file.path} (may need to verify)")
         
+        save_project_snapshot(config, {file.path: file.content for file in files})
+        
         return f"Great! I've created {len(files)} file{'s' if len(files) != 1 else ''} for your app."
     except Exception as e:
         return f"Sorry, I had trouble creating some files: {e}"
@@ -166,7 +371,7 @@ def read_files(file_paths: List[str], config: RunnableConfig) -> str:
         sandbox = config["configurable"]["sandbox"]
         
         # Send user-friendly message
-        print(f"🔍 I'm reviewing your existing code to understand what you already have...")
+        notify(config, f"🔍 I'm reviewing your existing code to understand what you already have...")
         
         # Actually read files and return content for LLM
         results = []
@@ -186,10 +391,10 @@ def read_files(file_paths: List[str], config: RunnableConfig) -> str:
                 })
         
         # Return actual file content as JSON for LLM decision making
-        return json.dumps(results, indent=2)
+        return json.dumps(results, ensure_ascii=False, separators=(",", ":"))
     except Exception as e:
         error_msg = f"File reading failed: {e}"
-        print(f"😅 Sorry, I had trouble reading your existing files: {e}")
+        notify(config, f"😅 Sorry, I had trouble reading your existing files: {e}")
         return error_msg
 
 @tool(args_schema=TaskComplete)
@@ -197,6 +402,11 @@ def task_complete(summary: str, files_created: List[str]) -> str:
     """Mark the task as complete with a summary. This will end the agent execution."""
     return f"Perfect! I've completed your request. {summary}"
 
+@tool(ESCALATION_TOOL, args_schema=EscalateInput)
+def escalate_to_primary(reason: str) -> str:
+    """Call this when the next step needs to create or update files. Another model will take over this step."""
+    return reason
+
 # ========================
 # AGENT NODES
 # ========================
@@ -204,21 +414,51 @@ def task_complete(summary: str, files_created: List[str]) -> str:
 # Collect all tools
 tools = [terminal, create_or_update_files, read_files, task_complete]
 tools_by_name = {tool.name: tool for tool in tools}
+# The fast tier can read, run commands and finish, or hand the step back
+fast_tools = [tool for tool in tools if tool.name in FAST_TOOLS] + [escalate_to_primary]
 
-def llm_call(state: State):
-    """LLM decides what action to take next"""
+def build_llm(model: str, timeout: float, tool_choice: str = "any", tier: str = TIER_PRIMARY):
+    """Build a single-attempt LLM client with the tier's tools bound (retries are owned by the transport)"""
     llm = ChatOpenAI(
-        model=state["model"],
-        openai_api_base="https://openrouter.ai/api/v1",
+        model=model,
+        openai_api_base=OPENROUTER_BASE_URL,
         openai_api_key=OPENROUTER_API_KEY,
-        temperature=0.1
+        temperature=0.1,
+        timeout=timeout,
+        max_retries=0
     )
-    llm_with_tools = llm.bind_tools(tools, tool_choice="any")
+    return llm.bind_tools(fast_tools if tier == TIER_FAST else tools, tool_choice=tool_choice)
+
+# Shared transport so latency history and circuit state persist across runs
+llm_transport = LLMTransport(build_llm)
+
+def llm_call(state: State):
+    """LLM decides what action to take next"""
+    started_at = state.get("started_at") or time.time()
+    state = {**state, "started_at": started_at}
+    wrap_up = should_wrap_up(state)
+    run_memory.update(project_key(state.get("user_id", ""), state.get("project_id", "")), state_footprint(state))
     
     # Enhance system prompt based on session type
     system_prompt = SYSTEM_PROMPT
     
     if state["session_type"] == "continuing":
+        project_index = state.get("project_index")
+        if project_index:
+            # The index replaces exploratory reads: the model picks exactly the files it needs
+            read_first = "**READ ONLY WHAT YOU NEED**: Use <project_index> (in the first user message) to pick the files you will change (and the components they use), then read_files them in ONE call"
+            reading_strategy = """- The project index lists every file with its exports and local imports
+- Do not read files just to discover the structure; the index already shows it
+- Tool results report later changes to the index ("Project index changes: ...")
+- Read a file before modifying it; skip files the change does not touch
+- Check installed packages in the index before running npm install"""
+        else:
+            read_first = '**ALWAYS READ FIRST**: read_files(["app/page.tsx"]) to understand existing structure'
+            reading_strategy = """- ALWAYS start with app/page.tsx to understand main app structure
+- Read relevant component files before modifying them
+- Use read_files tool to understand existing code patterns
+- Focus on understanding existing functionality before making changes"""
+        
         session_context = f"""
 
 <continuing_session>
@@ -229,7 +469,7 @@ def llm_call(state: State):
 </conversation_history>
 
 <mandatory_continuing_workflow>
-1. **ALWAYS READ FIRST**: read_files(["app/page.tsx"]) to understand existing structure
+1. {read_first}
 2. **CHECK FOR PACKAGES**: If new feature needs external packages → terminal("npm install package-name --yes")
 3. **PRESERVE EXISTING**: Modify existing files, don't replace unless absolutely necessary
 4. **MAINTAIN 'use client'**: Keep existing 'use client' directives and add to new interactive components
@@ -237,10 +477,7 @@ def llm_call(state: State):
 </mandatory_continuing_workflow>
 
 <reading_strategy>
-- ALWAYS start with app/page.tsx to understand main app structure
-- Read relevant component files before modifying them
-- Use read_files tool to understand existing code patterns
-- Focus on understanding existing functionality before making changes
+{reading_strategy}
 </reading_strategy>
 
 <session_goals>
@@ -253,16 +490,67 @@ def llm_call(state: State):
 """
         system_prompt += session_context
     
-    messages = [{"role": "system", "content": system_prompt}] + state["messages"]
-    response = llm_with_tools.invoke(messages)
+    def run_wrap_up():
+        """Budget nearly spent: force a final task_complete turn, bounded even past the wall budget"""
+        deadline = time.monotonic() + WRAP_UP_TIMEOUT
+        
+        def invoke_step(model: str, messages: List[Any], tier: str):
+            return llm_transport.invoke(model, messages, deadline=deadline, tool_choice="task_complete", tier=tier)
+        
+        messages = [{"role": "system", "content": system_prompt + WRAP_UP_PROMPT}] + state["messages"]
+        try:
+            return routed_invoke(state, messages, invoke_step)
+        except Exception as e:
+            # Even the wrap-up turn failed; finish with what was built so far
+            return budget_stop_message(state), []
     
-    return {"messages": [response]}
+    if wrap_up:
+        response, step_metrics = run_wrap_up()
+    else:
+        # Keep the call inside the wall-clock budget
+        deadline = time.monotonic() + max(0.0, remaining_wall_time(state))
+        
+        def invoke_step(model: str, messages: List[Any], tier: str):
+            return llm_transport.invoke(model, messages, deadline=deadline, tier=tier)
+        
+        messages = [{"role": "system", "content": system_prompt}] + state["messages"]
+        try:
+            # Route cheap steps to the fast model, file generation to the requested one
+            response, step_metrics = routed_invoke(state, messages, invoke_step)
+        except DeadlineExceededError:
+            # The turn ran past the wall-clock budget; wrap up instead of failing the run
+            wrap_up = True
+            response, step_metrics = run_wrap_up()
+    response = drop_raw_tool_calls(response)
+    for metric in step_metrics:
+        metric["step"] = state.get("steps", 0) + 1
+    
+    return {
+        "messages": [response],
+        "step_metrics": step_metrics,
+        "steps": state.get("steps", 0) + 1,
+        "started_at": started_at,
+        "wrapped_up": wrap_up
+    }
+
+def budget_stop_message(state: State) -> AIMessage:
+    """Stand-in task_complete call for when the wrap-up turn itself could not complete"""
+    return AIMessage(content="", tool_calls=[{
+        "name": "task_complete",
+        "args": {
+            "summary": "I ran out of time for this request. The files written so far are saved; ask me to continue to finish the rest.",
+            "files_created": list(state.get("files_created", {}))
+        },
+        "id": f"call_budget_{uuid.uuid4().hex[:8]}"
+    }])
 
 def tool_handler(state: State, stream_callback=None):
     """Execute the tools called by the LLM"""
     
     result_messages = []
-    files_created = state.get("files_created", {}).copy()  # Get current files_created
+    verifications = []
+    files_created = {}  # Files written this step (merged into state by the reducer)
+    project_index = state.get("project_index")
     
     # Get the last message (should contain tool calls)
     last_message = state["messages"][-1]
@@ -270,8 +558,25 @@ def tool_handler(state: State, stream_callback=None):
     if not last_message.tool_calls:
         return {"messages": []}
     
+    # Tools need the sandbox; wait here if it is still booting
+    sandbox = resolve_sandbox(state["sandbox"])
+    sandbox_updates = {}
+    if sandbox is not state["sandbox"]:
+        sandbox_updates = {
+            "sandbox": sandbox,
+            "sandbox_id": sandbox.sandbox_id,
+            "sandbox_url": f"https://{sandbox.get_host(3000)}"
+        }
+    sandbox_id = sandbox.sandbox_id
+    
+    lease = state.get("lease")
+    
     # Execute each tool call
     for tool_call in last_message.tool_calls:
+        # Never touch the sandbox once another worker may own the project
+        if lease is not None:
+            lease.check()
+        
         tool_name = tool_call["name"]
         tool_args = tool_call["args"].copy()  # Make a copy to avoid mutation issues
         tool_id = tool_call["id"]
@@ -282,7 +587,12 @@ def tool_handler(state: State, stream_callback=None):
             
             # Create minimal RunnableConfig to avoid parent_run_id issues
             config = RunnableConfig(
-                configurable={"sandbox": state["sandbox"]},
+                configurable={
+                    "sandbox": sandbox,
+                    "user_id": state.get("user_id", ""),
+                    "project_id": state.get("project_id", ""),
+                    "stream_callback": stream_callback
+                },
                 run_name=f"tool_{tool_name}",
                 tags=[f"tool:{tool_name}"]
             )
@@ -322,6 +632,40 @@ def tool_handler(state: State, stream_callback=None):
                 except Exception as e:
                     if stream_callback:
                         stream_callback(f"😅 Had a small issue while creating files, but continuing...")
+                
+                # Keep the project index in step with what was written
+                if project_index is not None:
+                    previous_index, project_index = project_index, update_index(project_index, {
+                        file_data["path"]: file_data.get("content", "")
+                        for file_data in tool_args.get("files", []) if file_data.get("path")
+                    })
+                    save_index(sandbox_id, project_index)
+                    index_changes = describe_changes(previous_index, project_index)
+                    if index_changes:
+                        observation = f"{observation}\n\n{index_changes}"
+                
+                # Check the new code compiles so the model can fix errors in this run
+                written_paths = [file_data.get("path") for file_data in tool_args.get("files", []) if file_data.get("path")]
+                if VERIFY_ENABLED and written_paths and str(observation).startswith("Great!"):
+                    if stream_callback:
+                        stream_callback(f"🔎 Making sure everything compiles...")
+                    verification = check_compile(sandbox, written_paths)
+                    verifications.append(verification)
+                    observation = f"{observation}\n\n{format_compile_feedback(verification)}"
+                    if not verification["ok"] and stream_callback:
+                        stream_callback(f"🛠️ Found a small problem in the code, fixing it now...")
+            
+            # Commands that can add, move or delete files and packages invalidate the index
+            if tool_name == "terminal" and may_change_files(tool_args.get("command", "")):
+                if project_index is not None:
+                    rebuilt = refresh_index(sandbox)
+                    if rebuilt is not None:
+                        index_changes = describe_changes(project_index, rebuilt)
+                        project_index = rebuilt
+                        if index_changes:
+                            observation = f"{observation}\n\n{index_changes}"
+                else:
+                    invalidate_index(sandbox_id)
             
             # Create tool message
             result_messages.append({
@@ -340,10 +684,17 @@ def tool_handler(state: State, stream_callback=None):
                 "tool_call_id": tool_id
             })
     
+    # Bound the run's memory: spill older file bodies to disk and compact old history
+    files_created.update(spill_files(merge_files(state.get("files_created", {}), files_created)))
+    result_messages = compact_messages(state["messages"]) + result_messages
+    
     # Return updated state with files_created
     return {
         "messages": result_messages,
-        "files_created": files_created
+        "files_created": files_created,
+        "verifications": verifications,
+        "project_index": project_index,
+        **sandbox_updates
     }
 
 def should_continue(state: State) -> Literal["tool_handler", "__end__"]:
@@ -355,11 +706,19 @@ def should_continue(state: State) -> Literal["tool_handler", "__end__"]:
         for tool_call in last_message.tool_calls:
             if tool_call["name"] == "task_complete":
                 return END  # End immediately when task_complete is called
-        return "tool_handler"  # Continue to tool handler for other tools
+        # Always run the turn's tool calls so generated files are not dropped;
+        # after_tools stops the run once the budget is spent
+        return "tool_handler"
     
     # If no tool calls, end the conversation
     return END
 
+def after_tools(state: State) -> Literal["llm_call", "__end__"]:
+    """End after the wrap-up turn's tools; a spent budget makes the next llm_call the wrap-up turn"""
+    if state.get("wrapped_up"):
+        return END
+    return "llm_call"
+
 # ========================
 # GRAPH ASSEMBLY  
 # ========================
@@ -388,7 +747,14 @@ def create_code_agent(stream_callback=None):
             END: END,
         },
     )
-    workflow.add_edge("tool_handler", "llm_call")
+    workflow.add_conditional_edges(
+        "tool_handler",
+        after_tools,
+        {
+            "llm_call": "llm_call",
+            END: END,
+        },
+    )
     
     # Compile the agent
     return workflow.compile()
@@ -397,45 +763,26 @@ def create_code_agent(stream_callback=None):
 # STREAMING SUPPORT
 # ========================
 
-import sys
-import io
-from contextlib import redirect_stdout
-from typing import AsyncGenerator
-
-class StreamCapture:
-    """Captures print statements and yields them as they occur"""
-    
-    def __init__(self, stream_callback):
-        self.stream_callback = stream_callback
-        self.buffer = ""
-    
-    def write(self, text):
-        """Capture print statements and send them to the stream callback"""
-        self.buffer += text
-        if text.endswith('\n'):
-            # Send the complete line
-            line = self.buffer.rstrip()
-            if line:  # Only send non-empty lines
-                self.stream_callback(line)
-            self.buffer = ""
-    
-    def flush(self):
-        """Flush any remaining buffer content"""
-        if self.buffer:
-            self.stream_callback(self.buffer.rstrip())
-            self.buffer = ""
-
 async def stream_agent_execution(initial_state: State, stream_callback) -> State:
-    """Execute the agent with streaming support"""
+    """Execute the agent with streaming support
+    
+    The graph runs on its own thread for the whole build (not asyncio's default executor,
+    which would cap concurrent builds); stream_callback is called from that thread as
+    progress messages are produced.
+    """
     
     # Create agent with stream callback
     agent = create_code_agent(stream_callback)
     
-    # Capture print statements from other parts
-    with redirect_stdout(StreamCapture(stream_callback)):
-        # Run the workflow
-        final_state = agent.invoke(initial_state)
-        return final_state
+    # Run the workflow
+    final_state = await asyncio.wrap_future(start_thread(
+        lambda: agent.invoke(
+            initial_state,
+            config={"recursion_limit": recursion_limit(initial_state.get("budget"))}
+        ),
+        name="agent-build"
+    ))
+    return final_state
 
 # ========================
 # EXPORT GLOBAL WORKFLOW
@@ -466,7 +813,7 @@ def extract_task_summary(final_state: State) -> str:
 
 def extract_files_created(final_state: State) -> Dict[str, str]:
     """Extract the files created from the final state"""
-    return final_state.get("files_created", {})
+    return materialize_files(final_state.get("files_created", {}))
 
 def get_agent_result_summary(final_state: State) -> Dict[str, Any]:
     """Get a comprehensive summary of the agent's execution results"""
@@ -476,5 +823,9 @@ def get_agent_result_summary(final_state: State) -> Dict[str, Any]:
         "total_files": len(final_state.get("files_created", {})),
         "session_type": final_state.get("session_type", "new"),
         "sandbox_id": final_state.get("sandbox_id", ""),
-        "sandbox_url": final_state.get("sandbox_url", "")
+        "sandbox_url": final_state.get("sandbox_url", ""),
+        "usage": summarize_step_metrics(final_state.get("step_metrics", [])),
+        "step_metrics": final_state.get("step_metrics", []),
+        "budget": budget_report(final_state),
+        "verifications": final_state.get("verifications", [])
     }
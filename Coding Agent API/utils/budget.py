@@ -0,0 +1,96 @@
+import os
+import time
+from typing import Dict, Any, List, Optional
+from pydantic import BaseModel, Field
+
+# Configuration (defaults applied when a request does not set its own budget)
+DEFAULT_MAX_STEPS = int(os.getenv("AGENT_MAX_STEPS", "20"))
+DEFAULT_MAX_INPUT_TOKENS = int(os.getenv("AGENT_MAX_INPUT_TOKENS", "500000"))
+DEFAULT_MAX_OUTPUT_TOKENS = int(os.getenv("AGENT_MAX_OUTPUT_TOKENS", "100000"))
+DEFAULT_MAX_WALL_TIME = float(os.getenv("AGENT_MAX_WALL_TIME", "600"))
+# Fraction of any budget after which the agent is told to wrap up
+BUDGET_WRAP_UP_RATIO = float(os.getenv("AGENT_BUDGET_WRAP_UP_RATIO", "0.85"))
+# Seconds the forced wrap-up turn may take, even when the wall-clock budget is already spent
+WRAP_UP_TIMEOUT = float(os.getenv("AGENT_WRAP_UP_TIMEOUT", "60"))
+
+WRAP_UP_PROMPT = """
+
+<budget_exhausted>
+You are about to run out of budget for this request. Do not start new work.
+Call task_complete now with a summary of what was accomplished and what is left to do.
+</budget_exhausted>
+"""
+
+class AgentBudget(BaseModel):
+    """Per-request limits for one agent run (unset fields use the server defaults)"""
+    max_steps: Optional[int] = Field(default=None, gt=0, description="Maximum number of LLM turns")
+    max_input_tokens: Optional[int] = Field(default=None, gt=0, description="Maximum prompt tokens across all turns")
+    max_output_tokens: Optional[int] = Field(default=None, gt=0, description="Maximum completion tokens across all turns")
+    max_wall_time: Optional[float] = Field(default=None, gt=0, description="Maximum run time in seconds")
+
+# ========================
+# BUDGET ACCOUNTING
+# ========================
+
+def resolve_budget(budget: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Fill unset limits with the server defaults"""
+    defaults = {
+        "max_steps": DEFAULT_MAX_STEPS,
+        "max_input_tokens": DEFAULT_MAX_INPUT_TOKENS,
+        "max_output_tokens": DEFAULT_MAX_OUTPUT_TOKENS,
+        "max_wall_time": DEFAULT_MAX_WALL_TIME,
+    }
+    budget = budget or {}
+    return {name: default if budget.get(name) is None else budget[name] for name, default in defaults.items()}
+
+def recursion_limit(budget: Optional[Dict[str, Any]] = None) -> int:
+    """LangGraph recursion limit that leaves room for every allowed turn plus the wrap-up turn"""
+    # Each turn is an llm_call step followed by a tool_handler step
+    return 2 * (resolve_budget(budget)["max_steps"] + 1) + 5
+
+def budget_usage(state: Dict[str, Any]) -> Dict[str, Any]:
+    """What the run has consumed so far"""
+    step_metrics = state.get("step_metrics", [])
+    started_at = state.get("started_at") or time.time()
+    return {
+        "steps": state.get("steps", 0),
+        "input_tokens": sum(metric["input_tokens"] for metric in step_metrics),
+        "output_tokens": sum(metric["output_tokens"] for metric in step_metrics),
+        "wall_time": round(time.time() - started_at, 3),
+    }
+
+def _ratios(usage: Dict[str, Any], limits: Dict[str, Any]) -> Dict[str, float]:
+    return {
+        "steps": usage["steps"] / limits["max_steps"],
+        "input_tokens": usage["input_tokens"] / limits["max_input_tokens"],
+        "output_tokens": usage["output_tokens"] / limits["max_output_tokens"],
+        "wall_time": usage["wall_time"] / limits["max_wall_time"],
+    }
+
+def exhausted_budgets(state: Dict[str, Any]) -> List[str]:
+    """Names of the budgets the run has used up"""
+    ratios = _ratios(budget_usage(state), resolve_budget(state.get("budget")))
+    return [name for name, ratio in ratios.items() if ratio >= 1]
+
+def should_wrap_up(state: Dict[str, Any]) -> bool:
+    """Whether the next turn should be the forced wrap-up turn"""
+    limits = resolve_budget(state.get("budget"))
+    usage = budget_usage(state)
+    # The coming turn is the last one the step budget allows
+    if usage["steps"] + 1 >= limits["max_steps"]:
+        return True
+    return any(ratio >= BUDGET_WRAP_UP_RATIO for ratio in _ratios(usage, limits).values())
+
+def remaining_wall_time(state: Dict[str, Any]) -> float:
+    """Seconds left before the wall-clock budget runs out"""
+    limits = resolve_budget(state.get("budget"))
+    return limits["max_wall_time"] - budget_usage(state)["wall_time"]
+
+def budget_report(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Limits, consumption and outcome for the completion event"""
+    return {
+        "limits": resolve_budget(state.get("budget")),
+        "used": budget_usage(state),
+        "exhausted": exhausted_budgets(state),
+        "wrapped_up": state.get("wrapped_up", False),
+    }
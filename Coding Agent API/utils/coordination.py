@@ -0,0 +1,337 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+
+# Configuration
+# "redis://host:6379/0" for shared production state; empty for the local SQLite backend
+COORDINATION_URL = os.getenv("COORDINATION_URL", "")
+COORDINATION_DB_PATH = os.getenv(
+    "COORDINATION_DB_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".coordination", "coordination.sqlite3")
+)
+PROJECT_LEASE_TTL = float(os.getenv("PROJECT_LEASE_TTL", "120"))  # Seconds a lease lives without renewal
+PROJECT_LEASE_WAIT = float(os.getenv("PROJECT_LEASE_WAIT", "10"))  # Seconds to wait for a busy project
+MESSAGE_RETENTION = float(os.getenv("COORDINATION_MESSAGE_RETENTION", "86400"))  # Seconds fan-out messages are kept
+
+class ProjectBusyError(Exception):
+    """Raised when another worker holds the lease on a project"""
+
+class LeaseLostError(Exception):
+    """Raised when a run's project lease could not be renewed and may now belong to another worker"""
+
+# ========================
+# BACKEND INTERFACE
+# ========================
+
+class CoordinationBackend(ABC):
+    """State shared by every worker process and replica
+
+    - leases: exclusive, expiring ownership of a key (one build per project at a time)
+    - registry: small shared key/value records (e.g. which sandbox belongs to a project)
+    - messages: append-only channels that any worker can read from a cursor (event fan-out)
+
+    Backends must implement every method; a missing one fails when the backend is created.
+    """
+
+    @abstractmethod
+    def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        ...
+
+    @abstractmethod
+    def renew_lease(self, key: str, owner: str, ttl: float) -> bool:
+        ...
+
+    @abstractmethod
+    def release_lease(self, key: str, owner: str) -> None:
+        ...
+
+    @abstractmethod
+    def registry_set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    def registry_get(self, key: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def registry_delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def publish(self, channel: str, message: Dict[str, Any]) -> str:
+        """Append a message to a channel and return its cursor"""
+
+    @abstractmethod
+    def read(self, channel: str, after: Optional[str] = None, timeout: float = 0) -> List[Tuple[str, Dict[str, Any]]]:
+        """Messages after a cursor (all of them if None), waiting up to timeout seconds for new ones"""
+
+# ========================
+# LOCAL BACKEND (SQLITE)
+# ========================
+
+class SQLiteCoordination(CoordinationBackend):
+    """Coordination through a SQLite file: exclusive across processes on one host, no services needed"""
+
+    def __init__(self, path: str = COORDINATION_DB_PATH, poll_interval: float = 0.1):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connect().executescript("""
+            CREATE TABLE IF NOT EXISTS leases (
+                key TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS registry (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel TEXT NOT NULL,
+                message TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS messages_channel ON messages (channel, id);
+        """)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction that takes the database lock up front"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT owner, expires_at FROM leases WHERE key = ?", (key,)).fetchone()
+            if row and row[0] != owner and row[1] > now:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO leases (key, owner, expires_at) VALUES (?, ?, ?)", (key, owner, now + ttl)
+            )
+            return True
+
+    def renew_lease(self, key: str, owner: str, ttl: float) -> bool:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE leases SET expires_at = ? WHERE key = ? AND owner = ?", (time.time() + ttl, key, owner)
+            )
+            return cursor.rowcount == 1
+
+    def release_lease(self, key: str, owner: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, owner))
+
+    def registry_set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO registry (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at)
+            )
+
+    def registry_get(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute("SELECT value, expires_at FROM registry WHERE key = ?", (key,)).fetchone()
+        if not row or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return json.loads(row[0])
+
+    def registry_delete(self, key: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM registry WHERE key = ?", (key,))
+
+    def publish(self, channel: str, message: Dict[str, Any]) -> str:
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO messages (channel, message, created_at) VALUES (?, ?, ?)",
+                (channel, json.dumps(message), now)
+            )
+            message_id = cursor.lastrowid
+            # Trim expired messages now and then instead of running a cleanup job
+            if message_id % 1000 == 0:
+                conn.execute("DELETE FROM messages WHERE created_at < ?", (now - MESSAGE_RETENTION,))
+        return str(message_id)
+
+    def read(self, channel: str, after: Optional[str] = None, timeout: float = 0) -> List[Tuple[str, Dict[str, Any]]]:
+        deadline = time.monotonic() + timeout
+        while True:
+            rows = self._connect().execute(
+                "SELECT id, message FROM messages WHERE channel = ? AND id > ? ORDER BY id",
+                (channel, int(after or 0))
+            ).fetchall()
+            if rows or time.monotonic() >= deadline:
+                return [(str(message_id), json.loads(message)) for message_id, message in rows]
+            time.sleep(self.poll_interval)
+
+# ========================
+# PRODUCTION BACKEND (REDIS)
+# ========================
+
+class RedisCoordination(CoordinationBackend):
+    """Coordination through Redis (or any Redis-compatible server) for multi-node deployments"""
+
+    # Only the owner may extend or delete a lease
+    _RENEW_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) else return 0 end"
+    _RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+    def __init__(self, url: str = COORDINATION_URL, prefix: str = "autocoder:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("COORDINATION_URL points at Redis but the 'redis' package is not installed") from e
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        lease_key = f"{self.prefix}lease:{key}"
+        if self.client.set(lease_key, owner, nx=True, px=int(ttl * 1000)):
+            return True
+        # Re-entrant for the current owner
+        return self.renew_lease(key, owner, ttl)
+
+    def renew_lease(self, key: str, owner: str, ttl: float) -> bool:
+        return bool(self.client.eval(self._RENEW_SCRIPT, 1, f"{self.prefix}lease:{key}", owner, int(ttl * 1000)))
+
+    def release_lease(self, key: str, owner: str) -> None:
+        self.client.eval(self._RELEASE_SCRIPT, 1, f"{self.prefix}lease:{key}", owner)
+
+    def registry_set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        self.client.set(f"{self.prefix}registry:{key}", json.dumps(value), px=int(ttl * 1000) if ttl else None)
+
+    def registry_get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.client.get(f"{self.prefix}registry:{key}")
+        return json.loads(value) if value else None
+
+    def registry_delete(self, key: str) -> None:
+        self.client.delete(f"{self.prefix}registry:{key}")
+
+    def publish(self, channel: str, message: Dict[str, Any]) -> str:
+        stream = f"{self.prefix}channel:{channel}"
+        message_id = self.client.xadd(stream, {"message": json.dumps(message)}, maxlen=10000, approximate=True)
+        self.client.expire(stream, int(MESSAGE_RETENTION))
+        return message_id
+
+    def read(self, channel: str, after: Optional[str] = None, timeout: float = 0) -> List[Tuple[str, Dict[str, Any]]]:
+        stream = f"{self.prefix}channel:{channel}"
+        block = int(timeout * 1000) if timeout > 0 else None
+        result = self.client.xread({stream: after or "0-0"}, block=block)
+        return [
+            (message_id, json.loads(fields["message"]))
+            for _, entries in result or []
+            for message_id, fields in entries
+        ]
+
+# ========================
+# SHARED BACKEND AND LEASES
+# ========================
+
+def create_backend(url: str = COORDINATION_URL) -> CoordinationBackend:
+    """Pick the backend from COORDINATION_URL"""
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCoordination(url)
+    return SQLiteCoordination()
+
+_backend: Optional[CoordinationBackend] = None
+_backend_lock = threading.Lock()
+
+def get_backend() -> CoordinationBackend:
+    """Process-wide coordination backend, created on first use"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend()
+        return _backend
+
+def project_key(user_id: str, project_id: str) -> str:
+    return f"project:{user_id}/{project_id}"
+
+def new_owner_id() -> str:
+    """Unique lease owner id for one run in this process"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class ProjectLease:
+    """Exclusive, self-renewing lease on one project for the duration of a run"""
+
+    def __init__(self, user_id: str, project_id: str, ttl: float = PROJECT_LEASE_TTL,
+                 backend: Optional[CoordinationBackend] = None):
+        self.key = project_key(user_id, project_id)
+        self.ttl = ttl
+        self.owner = new_owner_id()
+        self.backend = backend or get_backend()
+        self._stop = threading.Event()
+        self._lost = threading.Event()
+        self._renewer: Optional[threading.Thread] = None
+
+    def acquire(self, wait: float = PROJECT_LEASE_WAIT) -> None:
+        """Take the lease, waiting up to wait seconds for a current holder to finish"""
+        deadline = time.monotonic() + wait
+        while not self.backend.acquire_lease(self.key, self.owner, self.ttl):
+            if time.monotonic() >= deadline:
+                raise ProjectBusyError(f"{self.key} is being worked on by another session")
+            time.sleep(0.5)
+        self._renewer = threading.Thread(target=self._renew_loop, daemon=True)
+        self._renewer.start()
+
+    def _renew_loop(self) -> None:
+        renewed_at = time.monotonic()
+        interval = self.ttl / 3
+        while not self._stop.wait(interval):
+            try:
+                if not self.backend.renew_lease(self.key, self.owner, self.ttl):
+                    # Someone else holds the key now
+                    self._lost.set()
+                    return
+                renewed_at = time.monotonic()
+                interval = self.ttl / 3
+            except Exception:
+                # Transient backend error (locked database, Redis blip): retry soon, until the lease expires
+                if time.monotonic() - renewed_at >= self.ttl:
+                    self._lost.set()
+                    return
+                interval = min(1.0, self.ttl / 10)
+
+    @property
+    def lost(self) -> bool:
+        """Whether renewal failed, so another worker may have taken the project"""
+        return self._lost.is_set()
+
+    def check(self) -> None:
+        """Raise LeaseLostError if the lease can no longer be relied on"""
+        if self.lost:
+            raise LeaseLostError(f"Lost the lease on {self.key}; stopping so two sessions never write to the same sandbox")
+
+    def release(self) -> None:
+        self._stop.set()
+        self.backend.release_lease(self.key, self.owner)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
@@ -0,0 +1,213 @@
+import json
+import time
+import asyncio
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Dict, Any, Optional, AsyncGenerator
+from pydantic import BaseModel
+from langchain_core.messages import HumanMessage
+
+from .coordination import ProjectLease, ProjectBusyError, project_key
+from .project_index import load_index, task_with_index
+from .memory import run_memory
+from .threads import start_thread
+from .agent import (
+    State,
+    ProjectSession,
+    resolve_sandbox,
+    get_agent_result_summary,
+    stream_agent_execution
+)
+
+# ========================
+# EVENT MODEL
+# ========================
+
+class StreamResponse(BaseModel):
+    type: str  # "status", "output", "error", "complete"
+    data: Dict[str, Any]
+    timestamp: str
+
+def make_event(event_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Build a stream event shared by the FastAPI and AgentCore entrypoints"""
+    return StreamResponse(type=event_type, data=data, timestamp=datetime.now().isoformat()).dict()
+
+def format_sse(event: Dict[str, Any], event_id: Optional[int] = None) -> str:
+    """Serialize an event as a server-sent events frame (with an id clients can resume from)"""
+    if event_id is not None:
+        return f"id: {event_id}\ndata: {json.dumps(event)}\n\n"
+    return f"data: {json.dumps(event)}\n\n"
+
+# ========================
+# SANDBOX PROVISIONING
+# ========================
+
+def provision_sandbox(user_id: str, project_id: str, timings: Dict[str, float]) -> Future:
+    """Start creating a sandbox in the background while the first model turn runs; the Future resolves to the Sandbox"""
+    def create():
+        started = time.perf_counter()
+        try:
+            sandbox, _ = ProjectSession.create_new_sandbox(user_id, project_id)
+            return sandbox
+        finally:
+            # Recorded before the Future resolves, so waiters always see it
+            timings["sandbox_provision"] = round(time.perf_counter() - started, 3)
+    return start_thread(create, name="sandbox-provision")
+
+def provisioning_timings(timings: Dict[str, float], step_metrics: list) -> Dict[str, float]:
+    """Compare sandbox boot and first model turn run back to back versus overlapped"""
+    first_turn = round(sum(metric["latency"] for metric in step_metrics if metric.get("step") == 1), 3)
+    provision = timings.get("sandbox_provision", 0.0)
+    return {
+        "sandbox_provision": provision,
+        "first_turn": first_turn,
+        "serialized_estimate": round(provision + first_turn, 3),
+        "overlapped": round(max(provision, first_turn), 3),
+    }
+
+# ========================
+# PROJECT EXECUTION
+# ========================
+
+async def run_project_events(
+    user_id: str,
+    project_id: str,
+    task: str,
+    conversation_history: Optional[str] = None,
+    model: str = "google/gemini-2.5-flash",
+    budget: Optional[Dict[str, Any]] = None
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """Run one build and yield status/output events as they happen, ending with complete or error"""
+    # Only one build may drive a project's sandbox at a time, across all workers and replicas
+    lease = ProjectLease(user_id, project_id)
+    try:
+        await asyncio.to_thread(lease.acquire)
+    except ProjectBusyError:
+        yield make_event("error", {
+            "message": "⏳ I'm still working on another request for this project. Please try again once it finishes.",
+            "project_busy": True
+        })
+        return
+    
+    run_key = project_key(user_id, project_id)
+    run_memory.start(run_key)
+    
+    def release():
+        run_memory.finish(run_key)
+        lease.release()
+    
+    agent_task = None
+    timings: Dict[str, float] = {}
+    try:
+        # Determine if this is a new or continuing project
+        sandbox = await asyncio.to_thread(ProjectSession.find_existing_sandbox, user_id, project_id)
+
+        if sandbox:
+            # Continuing existing project
+            yield make_event("status", {"message": "🎯 Great! I found your existing project. Let me add the new features you requested..."})
+            session_type = "continuing"
+            conversation_history = conversation_history or ""
+        else:
+            # Restore an expired sandbox from its last snapshot if we have one
+            sandbox = await asyncio.to_thread(ProjectSession.rehydrate_sandbox, user_id, project_id)
+
+            if sandbox:
+                yield make_event("status", {"message": "♻️ Your previous session expired, so I restored your project from its last saved version..."})
+                session_type = "continuing"
+                conversation_history = conversation_history or ""
+            else:
+                # Creating new project; the sandbox boots alongside the first model turn,
+                # and tools wait for it on first use
+                yield make_event("status", {"message": "✨ Perfect! I'm creating a brand new project for you..."})
+                sandbox = provision_sandbox(user_id, project_id, timings)
+                session_type = "new"
+                conversation_history = ""
+
+        yield make_event("status", {"message": "⚙️ Setting up the development environment..."})
+
+        # Continuing sessions get a map of the project instead of exploratory file reads
+        project_index = None
+        if session_type == "continuing":
+            project_index = await asyncio.to_thread(load_index, sandbox)
+
+        # Initialize state
+        provisioning = isinstance(sandbox, Future)
+        initial_state = State(
+            messages=[HumanMessage(content=task_with_index(task, project_index))],  # Index sent once per run
+            sandbox=sandbox,
+            sandbox_id="" if provisioning else sandbox.sandbox_id,
+            sandbox_url="" if provisioning else f"https://{sandbox.get_host(3000)}",
+            files_created={},
+            session_type=session_type,
+            conversation_history=conversation_history,
+            user_id=user_id,
+            project_id=project_id,
+            model=model,
+            budget=budget or {},
+            project_index=project_index,
+            lease=lease
+        )
+
+        yield make_event("status", {"message": "🎨 Now I'll start building your app..."})
+
+        # Progress messages arrive from the agent's worker thread
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def stream_callback(message: str):
+            """Forward agent progress messages to the event stream"""
+            loop.call_soon_threadsafe(queue.put_nowait, message)
+
+        agent_task = asyncio.create_task(stream_agent_execution(initial_state, stream_callback))
+
+        # Stream messages as they are produced until the agent finishes
+        while not (agent_task.done() and queue.empty()):
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.wait({getter, agent_task}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield make_event("output", {"message": getter.result()})
+            else:
+                getter.cancel()
+
+        final_state = agent_task.result()
+
+        if isinstance(final_state["sandbox"], Future):
+            # The agent finished without touching the sandbox; it still has to be ready for the preview
+            ready = await asyncio.to_thread(resolve_sandbox, final_state["sandbox"])
+            final_state = {
+                **final_state,
+                "sandbox": ready,
+                "sandbox_id": ready.sandbox_id,
+                "sandbox_url": f"https://{ready.get_host(3000)}"
+            }
+
+        # Extract results using new helper function
+        summary = get_agent_result_summary(final_state)
+
+        completion = {
+            "sandbox_url": final_state["sandbox_url"],
+            "sandbox_id": summary["sandbox_id"],
+            "session_type": summary["session_type"],
+            "files_created": summary["files_created"],  # Include both file paths and content
+            "total_files": summary["total_files"],
+            "task_summary": summary["task_summary"],
+            "usage": summary["usage"],
+            "budget": summary["budget"],
+            "verifications": summary["verifications"]  # Compile check errors and durations
+        }
+        if provisioning:
+            completion["timings"] = provisioning_timings(timings, final_state.get("step_metrics", []))
+
+        # Send completion with user-friendly message
+        yield make_event("complete", completion)
+
+    except Exception as e:
+        yield make_event("error", {"message": f"😅 Sorry, I encountered an issue while building your app: {str(e)}"})
+    
+    finally:
+        if agent_task is not None and not agent_task.done():
+            # The client went away mid-build; hold the lease until the agent stops using the sandbox
+            loop = asyncio.get_running_loop()
+            agent_task.add_done_callback(lambda _: loop.run_in_executor(None, release))
+        else:
+            await asyncio.to_thread(release)
@@ -0,0 +1,399 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import asyncio
+import threading
+from typing import Dict, Any, List, Optional, Tuple, AsyncGenerator, Callable
+from .coordination import CoordinationBackend, get_backend, PROJECT_LEASE_TTL
+
+# Configuration
+JOBS_DB_PATH = os.getenv(
+    "JOBS_DB_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".jobs", "jobs.sqlite3")
+)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))  # Seconds between checks for work from other processes
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "10"))  # Seconds between heartbeats for running jobs
+# Running jobs without a heartbeat this long are requeued; never sooner than the dead worker's project lease expires
+JOB_STALE_AFTER = max(
+    float(os.getenv("JOB_STALE_AFTER", str(PROJECT_LEASE_TTL + JOB_HEARTBEAT_INTERVAL))),
+    PROJECT_LEASE_TTL
+)
+JOB_BUSY_RETRY_DELAY = float(os.getenv("JOB_BUSY_RETRY_DELAY", "5"))  # First delay before retrying a job whose project is busy
+JOB_BUSY_RETRY_MAX_DELAY = float(os.getenv("JOB_BUSY_RETRY_MAX_DELAY", "60"))  # Cap for the doubling retry delay
+
+# Job statuses
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+FINISHED_STATUSES = {COMPLETED, FAILED}
+
+# ========================
+# PERSISTENT JOB STORE
+# ========================
+
+class JobStore:
+    """SQLite-backed job queue and per-job event log, safe to share between processes"""
+
+    def __init__(self, path: str = JOBS_DB_PATH):
+        self.path = path
+        # Identifies this process's claims so live jobs are never taken from it
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    claimed_by TEXT,
+                    heartbeat_at REAL,
+                    available_at REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+                CREATE TABLE IF NOT EXISTS job_events (
+                    job_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    event TEXT NOT NULL,
+                    PRIMARY KEY (job_id, seq)
+                );
+            """)
+            # Databases created before heartbeats and busy retries were added
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in (
+                ("claimed_by", "TEXT"),
+                ("heartbeat_at", "REAL"),
+                ("available_at", "REAL"),
+                ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+            ):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread; WAL lets readers attach while a worker writes"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def submit(self, payload: Dict[str, Any]) -> str:
+        """Queue a job and return its id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._connect().execute(
+            "INSERT INTO jobs (id, status, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, QUEUED, json.dumps(payload), now, now)
+        )
+        return job_id
+
+    def claim_next(self) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Atomically move the oldest queued job that is due to running, claimed by this process, and return it"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute(
+                "SELECT id, payload FROM jobs WHERE status = ? AND COALESCE(available_at, 0) <= ? "
+                "ORDER BY created_at LIMIT 1",
+                (QUEUED, now)
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, updated_at = ?, claimed_by = ?, heartbeat_at = ? WHERE id = ?",
+                    (RUNNING, now, self.worker_id, now, row[0])
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return (row[0], json.loads(row[1])) if row else None
+
+    def finish(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+            (status, error, time.time(), job_id)
+        )
+
+    def retry_later(self, job_id: str) -> float:
+        """Put a claimed job back on the queue after a doubling delay; returns the delay"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            attempts = conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+            delay = min(JOB_BUSY_RETRY_DELAY * 2 ** attempts, JOB_BUSY_RETRY_MAX_DELAY)
+            now = time.time()
+            conn.execute("DELETE FROM job_events WHERE job_id = ?", (job_id,))
+            conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ?, claimed_by = NULL, heartbeat_at = NULL, "
+                "available_at = ?, attempts = attempts + 1 WHERE id = ?",
+                (QUEUED, now, now + delay, job_id)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return delay
+
+    def heartbeat(self, job_ids: List[str]) -> None:
+        """Mark this process's running jobs as alive"""
+        if not job_ids:
+            return
+        placeholders = ", ".join("?" for _ in job_ids)
+        self._connect().execute(
+            f"UPDATE jobs SET heartbeat_at = ? WHERE claimed_by = ? AND status = ? AND id IN ({placeholders})",
+            (time.time(), self.worker_id, RUNNING, *job_ids)
+        )
+
+    def requeue_stale(self, stale_after: float = JOB_STALE_AFTER) -> int:
+        """Put running jobs whose worker stopped heartbeating back on the queue; returns how many
+
+        Jobs still heartbeating belong to live processes (other uvicorn workers, the old side of
+        a rolling restart) and are left alone.
+        """
+        cutoff = time.time() - stale_after
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            stale = [row[0] for row in conn.execute(
+                "SELECT id FROM jobs WHERE status = ? AND COALESCE(heartbeat_at, updated_at) < ?", (RUNNING, cutoff)
+            )]
+            for job_id in stale:
+                # Replayed jobs start a fresh event log
+                conn.execute("DELETE FROM job_events WHERE job_id = ?", (job_id,))
+                conn.execute(
+                    "UPDATE jobs SET status = ?, updated_at = ?, claimed_by = NULL, heartbeat_at = NULL WHERE id = ?",
+                    (QUEUED, time.time(), job_id)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(stale)
+
+    def append_event(self, job_id: str, event: Dict[str, Any]) -> int:
+        """Append an event to a job's log and return its sequence number (starting at 1)"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            seq = conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM job_events WHERE job_id = ?", (job_id,)
+            ).fetchone()[0]
+            conn.execute("INSERT INTO job_events (job_id, seq, event) VALUES (?, ?, ?)", (job_id, seq, json.dumps(event)))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return seq
+
+    def events_after(self, job_id: str, after: int = 0) -> List[Tuple[int, Dict[str, Any]]]:
+        """Events with sequence number greater than after, in order"""
+        rows = self._connect().execute(
+            "SELECT seq, event FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, after)
+        ).fetchall()
+        return [(seq, json.loads(event)) for seq, event in rows]
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job status and metadata, or None if unknown"""
+        row = self._connect().execute(
+            "SELECT id, status, error, created_at, updated_at, "
+            "(SELECT COUNT(*) FROM job_events WHERE job_id = jobs.id) FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if not row:
+            return None
+        return {
+            "job_id": row[0],
+            "status": row[1],
+            "error": row[2],
+            "created_at": row[3],
+            "updated_at": row[4],
+            "events": row[5],
+        }
+
+    def stats(self) -> Dict[str, int]:
+        """Number of jobs per status"""
+        rows = self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+# ========================
+# WORKER POOL
+# ========================
+
+class JobManager:
+    """Runs queued builds on a bounded pool of asyncio workers, independent of any HTTP connection
+
+    Job status and events are also published to the coordination backend so workers on other
+    nodes can report on and attach to jobs they do not run.
+    """
+
+    def __init__(
+        self,
+        run_job: Callable[..., AsyncGenerator[Dict[str, Any], None]],
+        store: Optional[JobStore] = None,
+        workers: int = JOB_WORKERS,
+        backend: Optional[CoordinationBackend] = None,
+    ):
+        self.run_job = run_job
+        self.store = store or JobStore()
+        self.workers = workers
+        self._backend = backend
+        self._tasks: List[asyncio.Task] = []
+        self._running: set = set()  # Ids of jobs this process is running
+        self._work_available: Optional[asyncio.Event] = None
+        self._new_events: Optional[asyncio.Condition] = None
+
+    @property
+    def backend(self) -> CoordinationBackend:
+        if self._backend is None:
+            self._backend = get_backend()
+        return self._backend
+
+    async def _publish_status(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        """Share a job's status with other nodes"""
+        record = {"status": status, "error": error, "updated_at": time.time()}
+        await asyncio.to_thread(self.backend.registry_set, f"job:{job_id}", record)
+        if status in FINISHED_STATUSES:
+            await asyncio.to_thread(self.backend.publish, f"job:{job_id}", {"status": status})
+
+    async def start(self) -> None:
+        self._work_available = asyncio.Event()
+        self._new_events = asyncio.Condition()
+        await asyncio.to_thread(self.store.requeue_stale)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, payload: Dict[str, Any]) -> str:
+        """Queue a build and wake a worker"""
+        job_id = await asyncio.to_thread(self.store.submit, payload)
+        await self._publish_status(job_id, QUEUED)
+        if self._work_available:
+            self._work_available.set()
+        return job_id
+
+    async def _notify_events(self) -> None:
+        async with self._new_events:
+            self._new_events.notify_all()
+
+    async def _heartbeat(self) -> None:
+        """Keep this process's jobs alive and recover jobs from processes that died"""
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                await asyncio.to_thread(self.store.heartbeat, list(self._running))
+                if await asyncio.to_thread(self.store.requeue_stale) and self._work_available:
+                    self._work_available.set()
+            except Exception:
+                pass
+
+    async def _worker(self) -> None:
+        while True:
+            claimed = await asyncio.to_thread(self.store.claim_next)
+            if not claimed:
+                # Sleep until a local submit, or poll for jobs submitted by other processes
+                self._work_available.clear()
+                try:
+                    await asyncio.wait_for(self._work_available.wait(), timeout=JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            job_id, payload = claimed
+            self._running.add(job_id)
+            status, error = FAILED, "Job finished without a result"
+            try:
+                await self._publish_status(job_id, RUNNING)
+                async for event in self.run_job(**payload):
+                    if event["type"] == "error" and event["data"].get("project_busy"):
+                        # Another build (or a crashed worker's unexpired lease) holds the project: wait for it
+                        status = QUEUED
+                        break
+                    seq = await asyncio.to_thread(self.store.append_event, job_id, event)
+                    await asyncio.to_thread(self.backend.publish, f"job:{job_id}", {"seq": seq, "event": event})
+                    await self._notify_events()
+                    if event["type"] == "complete":
+                        status, error = COMPLETED, None
+                    elif event["type"] == "error":
+                        status, error = FAILED, event["data"].get("message")
+            except Exception as e:
+                status, error = FAILED, str(e)
+            if status == QUEUED:
+                await asyncio.to_thread(self.store.retry_later, job_id)
+                self._running.discard(job_id)
+                try:
+                    await self._publish_status(job_id, QUEUED)
+                except Exception:
+                    pass
+                continue
+            await asyncio.to_thread(self.store.finish, job_id, status, error)
+            self._running.discard(job_id)
+            await self._notify_events()
+            try:
+                await self._publish_status(job_id, status, error)
+            except Exception:
+                pass
+
+    async def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job status from the local store, or from the shared registry for jobs on other nodes"""
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job:
+            return job
+        record = await asyncio.to_thread(self.backend.registry_get, f"job:{job_id}")
+        return {"job_id": job_id, **record} if record else None
+
+    async def follow(self, job_id: str, after: int = 0) -> AsyncGenerator[Tuple[int, Dict[str, Any]], None]:
+        """Yield a job's events after the given sequence number until it finishes
+
+        Detaching (closing the generator) has no effect on the job itself.
+        """
+        if await asyncio.to_thread(self.store.get, job_id) is None:
+            # Not in this node's queue; follow it through the coordination backend
+            async for item in self._follow_remote(job_id, after):
+                yield item
+            return
+
+        while True:
+            job = await asyncio.to_thread(self.store.get, job_id)
+            for seq, event in await asyncio.to_thread(self.store.events_after, job_id, after):
+                after = seq
+                yield seq, event
+            if job is None or job["status"] in FINISHED_STATUSES:
+                # Status was read before the events, so nothing was missed
+                return
+            # Woken by local workers; the timeout picks up events written by other processes
+            async with self._new_events:
+                try:
+                    await asyncio.wait_for(self._new_events.wait(), timeout=JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _follow_remote(self, job_id: str, after: int) -> AsyncGenerator[Tuple[int, Dict[str, Any]], None]:
+        """Replay and tail a job's events from the coordination backend"""
+        if await asyncio.to_thread(self.backend.registry_get, f"job:{job_id}") is None:
+            return
+        cursor = None
+        while True:
+            messages = await asyncio.to_thread(self.backend.read, f"job:{job_id}", cursor, JOB_POLL_INTERVAL)
+            for cursor, message in messages:
+                if message.get("status") in FINISHED_STATUSES:
+                    return
+                if message["seq"] > after:
+                    after = message["seq"]
+                    yield message["seq"], message["event"]
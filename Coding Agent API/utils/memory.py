@@ -0,0 +1,236 @@
+import os
+import time
+import threading
+import tracemalloc
+from typing import Dict, Any, List
+
+from langchain_core.messages import AIMessage, ToolMessage
+
+from .snapshot import snapshot_store
+
+# Configuration
+MEMORY_PROFILING = os.getenv("MEMORY_PROFILING", "false").lower() == "true"  # tracemalloc + GET /api/debug/memory
+MEMORY_TRACE_FRAMES = int(os.getenv("MEMORY_TRACE_FRAMES", "1"))  # Stack depth recorded per allocation
+# File bodies one run keeps in memory (approximate bytes); older ones beyond this are spilled to the snapshot store
+RUN_HISTORY_MAX_BYTES = int(os.getenv("RUN_HISTORY_MAX_BYTES", str(256 * 1024)))  # In the message history
+RUN_FILES_MAX_BYTES = int(os.getenv("RUN_FILES_MAX_BYTES", str(256 * 1024)))  # In files_created
+SPILL_MIN_FILE_BYTES = int(os.getenv("SPILL_MIN_FILE_BYTES", "1024"))  # Smaller bodies are not worth spilling
+
+# Start of the note that replaces a compacted body in the message history
+OMITTED_PREFIX = "<omitted:"
+
+# ========================
+# SPILLED FILE BODIES
+# ========================
+
+class SpilledFile:
+    """A file body held in the snapshot store instead of memory"""
+    __slots__ = ("digest", "size")
+
+    def __init__(self, digest: str, size: int):
+        self.digest = digest
+        self.size = size
+
+    def __repr__(self) -> str:
+        return f"SpilledFile({self.digest}, {self.size})"
+
+def spill(content: str) -> SpilledFile:
+    """Move a file body to disk (a no-op write if the snapshot store already has it)"""
+    return SpilledFile(snapshot_store.put_blob(content), len(content))
+
+def materialize(value: Any) -> str:
+    """File body for a files_created value, reading it back from disk if it was spilled"""
+    return snapshot_store.get_blob(value.digest) if isinstance(value, SpilledFile) else value
+
+def materialize_files(files: Dict[str, Any]) -> Dict[str, str]:
+    return {path: materialize(value) for path, value in files.items()}
+
+def merge_files(current: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+    """files_created reducer: nodes return only the files they changed
+
+    Keeps paths in last-write order: a rewritten file moves to the end, while a spilled
+    body (SpilledFile) stays where it was.
+    """
+    merged = dict(current or {})
+    for path, value in (update or {}).items():
+        if not isinstance(value, SpilledFile):
+            merged.pop(path, None)
+        merged[path] = value
+    return merged
+
+def spill_files(files: Dict[str, Any], limit: int = RUN_FILES_MAX_BYTES) -> Dict[str, SpilledFile]:
+    """Entries to replace so the inline bodies in files fit the limit, least recently written first"""
+    inline = sum(len(value) for value in files.values() if isinstance(value, str))
+    spilled = {}
+    for path, value in files.items():
+        if inline <= limit:
+            break
+        if isinstance(value, str) and len(value) >= SPILL_MIN_FILE_BYTES:
+            spilled[path] = spill(value)
+            inline -= len(value)
+    return spilled
+
+# ========================
+# MESSAGE HISTORY
+# ========================
+
+def drop_raw_tool_calls(message: AIMessage) -> AIMessage:
+    """Drop the provider's raw tool call JSON once it has been parsed
+
+    The raw arguments repeat every file body the model wrote; the parsed tool_calls are
+    what gets sent back to the model on later turns.
+    """
+    if (message.tool_calls or message.invalid_tool_calls) and "tool_calls" in message.additional_kwargs:
+        additional_kwargs = {k: v for k, v in message.additional_kwargs.items() if k != "tool_calls"}
+        return message.model_copy(update={"additional_kwargs": additional_kwargs})
+    return message
+
+def _written_bytes(message: AIMessage) -> int:
+    """Bytes of file content a message's writes still hold inline"""
+    return sum(
+        len(file.get("content", ""))
+        for tool_call in message.tool_calls if tool_call["name"] == "create_or_update_files"
+        for file in tool_call["args"].get("files", [])
+        if isinstance(file, dict) and not file.get("content", "").startswith(OMITTED_PREFIX)
+    )
+
+def _compact_writes(message: AIMessage) -> AIMessage:
+    tool_calls = []
+    for tool_call in message.tool_calls:
+        if tool_call["name"] == "create_or_update_files":
+            files = [
+                {**file, "content": f"{OMITTED_PREFIX} {len(file.get('content', ''))} bytes, already written to the sandbox; read_files to see it>"}
+                if isinstance(file, dict) else file
+                for file in tool_call["args"].get("files", [])
+            ]
+            tool_call = {**tool_call, "args": {**tool_call["args"], "files": files}}
+        tool_calls.append(tool_call)
+    return drop_raw_tool_calls(message.model_copy(update={"tool_calls": tool_calls}))
+
+def _compact_read(message: ToolMessage) -> ToolMessage:
+    return message.model_copy(update={
+        "content": f"{OMITTED_PREFIX} {len(message.content)} bytes of file contents read earlier; read_files again if you need them>"
+    })
+
+def compact_messages(messages: List[Any], limit: int = RUN_HISTORY_MAX_BYTES) -> List[Any]:
+    """Compacted copies of old messages (same ids) so the file bodies in the history fit the limit
+
+    Written files are already on the sandbox and in the project snapshot, so older write
+    arguments and read results are replaced with short notes, oldest first. The latest AI
+    message and its tool results are never touched.
+    """
+    last_ai = max((i for i, message in enumerate(messages) if isinstance(message, AIMessage)), default=-1)
+    read_ids = {
+        tool_call["id"]
+        for message in messages if isinstance(message, AIMessage)
+        for tool_call in message.tool_calls if tool_call["name"] == "read_files"
+    }
+
+    candidates = []
+    for message in messages[:max(last_ai, 0)]:
+        if isinstance(message, AIMessage):
+            size = _written_bytes(message)
+            if size >= SPILL_MIN_FILE_BYTES:
+                candidates.append((message, size, _compact_writes))
+        elif isinstance(message, ToolMessage) and message.tool_call_id in read_ids and not message.content.startswith(OMITTED_PREFIX):
+            if len(message.content) >= SPILL_MIN_FILE_BYTES:
+                candidates.append((message, len(message.content), _compact_read))
+
+    inline = history_bytes(messages)
+    compacted = []
+    for message, size, compact in candidates:
+        if inline <= limit:
+            break
+        compacted.append(compact(message))
+        inline -= size
+    return compacted
+
+def history_bytes(messages: List[Any]) -> int:
+    """Approximate size of the file bodies and tool results held in the message history"""
+    total = 0
+    for message in messages:
+        if isinstance(message, AIMessage):
+            total += _written_bytes(message)
+        elif isinstance(message, ToolMessage):
+            total += len(message.content)
+    return total
+
+# ========================
+# PER-RUN ACCOUNTING
+# ========================
+
+def state_footprint(state: Dict[str, Any]) -> Dict[str, int]:
+    """Approximate bytes of file content a run's state holds in memory and on disk"""
+    files = state.get("files_created", {})
+    return {
+        "messages": len(state.get("messages", [])),
+        "history_bytes": history_bytes(state.get("messages", [])),
+        "files_inline_bytes": sum(len(value) for value in files.values() if isinstance(value, str)),
+        "files_spilled_bytes": sum(value.size for value in files.values() if isinstance(value, SpilledFile)),
+    }
+
+class RunMemoryTracker:
+    """Latest and peak state footprint of each in-flight run"""
+
+    def __init__(self):
+        self._runs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def start(self, key: str) -> None:
+        with self._lock:
+            self._runs[key] = {"started_at": time.time(), "updates": 0, "peak_bytes": 0}
+
+    def update(self, key: str, footprint: Dict[str, int]) -> None:
+        """Record a run's footprint (ignored for runs not started through start)"""
+        with self._lock:
+            run = self._runs.get(key)
+            if run is None:
+                return
+            inline = footprint["history_bytes"] + footprint["files_inline_bytes"]
+            run.update(footprint, updates=run["updates"] + 1, peak_bytes=max(run["peak_bytes"], inline))
+
+    def finish(self, key: str) -> None:
+        with self._lock:
+            self._runs.pop(key, None)
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            runs = {key: dict(run) for key, run in self._runs.items()}
+        return {
+            "in_flight": len(runs),
+            "inline_bytes": sum(run.get("history_bytes", 0) + run.get("files_inline_bytes", 0) for run in runs.values()),
+            "runs": runs,
+        }
+
+# Shared tracker for every run in this process
+run_memory = RunMemoryTracker()
+
+# ========================
+# PROCESS PROFILING
+# ========================
+
+def start_profiling() -> None:
+    """Start tracemalloc when MEMORY_PROFILING is enabled"""
+    if MEMORY_PROFILING and not tracemalloc.is_tracing():
+        tracemalloc.start(MEMORY_TRACE_FRAMES)
+
+def memory_report(top: int = 15) -> Dict[str, Any]:
+    """Per-run footprints plus traced process memory and its largest allocation sites"""
+    report: Dict[str, Any] = {"tracing": tracemalloc.is_tracing(), "runs": run_memory.report()}
+    if not report["tracing"]:
+        return report
+
+    current, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ])
+    report.update({
+        "current_bytes": current,
+        "peak_bytes": peak,
+        "top_allocations": [
+            {"location": str(stat.traceback), "size_bytes": stat.size, "count": stat.count}
+            for stat in snapshot.statistics("lineno")[:top]
+        ],
+    })
+    return report
@@ -0,0 +1,250 @@
+import os
+import re
+import json
+import posixpath
+from typing import Dict, Any, List, Optional
+
+from .coordination import get_backend
+
+# Configuration
+PROJECT_ROOT = "/home/user"
+INDEX_MAX_FILE_BYTES = int(os.getenv("INDEX_MAX_FILE_BYTES", "20000"))  # Bytes of each file parsed for exports/imports
+INDEX_MAX_PROMPT_FILES = int(os.getenv("INDEX_MAX_PROMPT_FILES", "150"))
+INDEX_MAX_CHANGE_FILES = 20  # Files listed per kind of change in a tool result
+INDEX_TTL = int(os.getenv("INDEX_TTL", "600"))  # Seconds a cached index is kept; matches the sandbox lifetime
+
+SOURCE_EXTENSIONS = (".tsx", ".ts", ".jsx", ".js", ".mjs")
+UI_COMPONENTS_DIR = "components/ui/"
+
+EXPORT_PATTERNS = [
+    re.compile(r"export\s+default\s+(?:async\s+)?(?:function|class)\s+(\w+)"),
+    re.compile(r"export\s+(?:async\s+)?(?:function|const|let|class|interface|type|enum)\s+(\w+)"),
+    re.compile(r"export\s+default\s+(\w+)\s*;?\s*$", re.MULTILINE),
+]
+EXPORT_LIST_PATTERN = re.compile(r"export\s*\{([^}]+)\}")
+IMPORT_PATTERN = re.compile(r"""(?:import|export)\s[^'";]*?from\s+['"]([^'"]+)['"]|import\s+['"]([^'"]+)['"]""")
+
+# One command lists the tree, dumps the project's own sources and package.json
+BUILD_COMMAND = (
+    f"cd {PROJECT_ROOT} && "
+    "find . \\( -path ./node_modules -o -path ./.next -o -path ./.git \\) -prune -o -type f "
+    "\\( -name '*.tsx' -o -name '*.ts' -o -name '*.jsx' -o -name '*.js' -o -name '*.mjs' -o -name '*.css' \\) -print "
+    "| sort | while read f; do "
+    "echo \"@@FILE ${f#./} $(wc -c < \"$f\")\"; "
+    f"case \"$f\" in ./{UI_COMPONENTS_DIR}*|*.css) ;; *) head -c {INDEX_MAX_FILE_BYTES} \"$f\";; esac; echo; "
+    "done; echo '@@PACKAGE'; cat package.json"
+)
+
+# ========================
+# PARSING
+# ========================
+
+def parse_exports(content: str) -> List[str]:
+    """Names exported by a source file"""
+    names = []
+    for pattern in EXPORT_PATTERNS:
+        names.extend(pattern.findall(content))
+    for group in EXPORT_LIST_PATTERN.findall(content):
+        for item in group.split(","):
+            # "a as b" exports b
+            name = item.strip().split(" as ")[-1].strip()
+            if name:
+                names.append(name)
+    return list(dict.fromkeys(name for name in names if name != "default"))
+
+def _resolve_import(source_path: str, spec: str, known_paths: List[str]) -> Optional[str]:
+    """Map an import specifier to a project file path, or None for packages"""
+    if spec.startswith("@/"):
+        base = spec[2:]
+    elif spec.startswith("."):
+        base = posixpath.normpath(posixpath.join(posixpath.dirname(source_path), spec))
+    else:
+        return None
+    for candidate in [base] + [base + ext for ext in SOURCE_EXTENSIONS] + [f"{base}/index{ext}" for ext in SOURCE_EXTENSIONS]:
+        if candidate in known_paths:
+            return candidate
+    return base
+
+def parse_imports(source_path: str, content: str, known_paths: List[str]) -> List[str]:
+    """Project files imported by a source file"""
+    imports = []
+    for match in IMPORT_PATTERN.finditer(content):
+        resolved = _resolve_import(source_path, match.group(1) or match.group(2), known_paths)
+        if resolved and resolved not in imports:
+            imports.append(resolved)
+    return imports
+
+def parse_packages(package_json: str) -> List[str]:
+    """Runtime dependencies declared in package.json"""
+    try:
+        return sorted(json.loads(package_json).get("dependencies", {}))
+    except (ValueError, AttributeError):
+        return []
+
+def _file_entry(path: str, content: str, known_paths: List[str], size: Optional[int] = None) -> Dict[str, Any]:
+    entry = {"size": size if size is not None else len(content.encode("utf-8"))}
+    if path.endswith(SOURCE_EXTENSIONS) and not path.startswith(UI_COMPONENTS_DIR):
+        entry["exports"] = parse_exports(content)
+        entry["imports"] = parse_imports(path, content, known_paths)
+    return entry
+
+# ========================
+# BUILD AND UPDATE
+# ========================
+
+def build_index(sandbox) -> Dict[str, Any]:
+    """Index the sandbox project with a single command"""
+    result = sandbox.commands.run(BUILD_COMMAND, timeout=60)
+    output = result.stdout or ""
+    files_part, _, package_json = output.partition("@@PACKAGE\n")
+
+    raw_files = []
+    for chunk in files_part.split("@@FILE ")[1:]:
+        header, _, content = chunk.partition("\n")
+        path, _, size = header.rpartition(" ")
+        raw_files.append((path, int(size) if size.isdigit() else 0, content))
+
+    known_paths = [path for path, _, _ in raw_files]
+    return {
+        "files": {path: _file_entry(path, content, known_paths, size) for path, size, content in raw_files},
+        "packages": parse_packages(package_json),
+    }
+
+def update_index(index: Dict[str, Any], files: Dict[str, str]) -> Dict[str, Any]:
+    """Return a new index with written files re-parsed (the input index is not modified)"""
+    updated = {"files": dict(index.get("files", {})), "packages": index.get("packages", [])}
+    known_paths = list(updated["files"]) + list(files)
+    for path, content in files.items():
+        path = path[2:] if path.startswith("./") else path
+        if path == "package.json":
+            updated["packages"] = parse_packages(content)
+        updated["files"][path] = _file_entry(path, content, known_paths)
+    return updated
+
+def _describe_file(path: str, entry: Dict[str, Any]) -> str:
+    return f"{path} (exports: {', '.join(entry['exports'])})" if entry.get("exports") else path
+
+def _describe_paths(label: str, paths: List[str], describe) -> str:
+    shown = [describe(path) for path in paths[:INDEX_MAX_CHANGE_FILES]]
+    if len(paths) > INDEX_MAX_CHANGE_FILES:
+        shown.append(f"... {len(paths) - INDEX_MAX_CHANGE_FILES} more")
+    return f"{label} {', '.join(shown)}"
+
+def describe_changes(before: Dict[str, Any], after: Dict[str, Any]) -> str:
+    """Short note on how the index changed, for the tool result ("" if nothing the model relies on did)
+
+    The index is sent once at the start of a run; later changes reach the model this way so
+    the prompt prefix stays the same from turn to turn.
+    """
+    old_files, new_files = before.get("files", {}), after.get("files", {})
+    added = [path for path in new_files if path not in old_files]
+    removed = [path for path in old_files if path not in new_files]
+    changed = [
+        path for path in new_files
+        if path in old_files and new_files[path].get("exports") != old_files[path].get("exports")
+    ]
+    old_packages, new_packages = set(before.get("packages", [])), set(after.get("packages", []))
+
+    parts = []
+    if added:
+        parts.append(_describe_paths("added", added, lambda path: _describe_file(path, new_files[path])))
+    if changed:
+        parts.append(_describe_paths("exports changed in", changed, lambda path: _describe_file(path, new_files[path])))
+    if removed:
+        parts.append(_describe_paths("removed", removed, str))
+    if new_packages - old_packages:
+        parts.append(f"installed {', '.join(sorted(new_packages - old_packages))}")
+    if old_packages - new_packages:
+        parts.append(f"uninstalled {', '.join(sorted(old_packages - new_packages))}")
+    return f"Project index changes: {'; '.join(parts)}." if parts else ""
+
+# ========================
+# SHARED CACHE
+# ========================
+
+def _registry_key(sandbox_id: str) -> str:
+    return f"index:{sandbox_id}"
+
+def load_index(sandbox) -> Optional[Dict[str, Any]]:
+    """Cached index for the sandbox, building it on first use; None if it cannot be built"""
+    try:
+        index = get_backend().registry_get(_registry_key(sandbox.sandbox_id))
+        if index is None:
+            index = build_index(sandbox)
+            save_index(sandbox.sandbox_id, index)
+        return index
+    except Exception as e:
+        return None
+
+def save_index(sandbox_id: str, index: Dict[str, Any]) -> None:
+    """Share the index with other workers; never fails the caller"""
+    try:
+        get_backend().registry_set(_registry_key(sandbox_id), index, ttl=INDEX_TTL)
+    except Exception as e:
+        pass
+
+def refresh_index(sandbox) -> Optional[Dict[str, Any]]:
+    """Rebuild and share the index after changes it cannot follow (terminal commands)
+
+    Returns None and drops the cached copy if the rebuild fails, so no worker keeps
+    using an index that no longer matches the sandbox.
+    """
+    try:
+        index = build_index(sandbox)
+    except Exception as e:
+        invalidate_index(sandbox.sandbox_id)
+        return None
+    save_index(sandbox.sandbox_id, index)
+    return index
+
+def invalidate_index(sandbox_id: str) -> None:
+    """Drop the shared index so the next run rebuilds it; never fails the caller"""
+    try:
+        get_backend().registry_delete(_registry_key(sandbox_id))
+    except Exception as e:
+        pass
+
+# ========================
+# PROMPT FORMATTING
+# ========================
+
+def _format_size(size: int) -> str:
+    return f"{size / 1024:.1f}KB" if size >= 1024 else f"{size}B"
+
+def format_index(index: Dict[str, Any]) -> str:
+    """Compact, prompt-ready description of the project"""
+    files = index.get("files", {})
+    lines = []
+    ui_components = []
+    for path in sorted(files):
+        if path.startswith(UI_COMPONENTS_DIR):
+            ui_components.append(posixpath.splitext(posixpath.basename(path))[0])
+            continue
+        entry = files[path]
+        line = f"{path} ({_format_size(entry['size'])})"
+        if entry.get("exports"):
+            line += f" exports: {', '.join(entry['exports'])}"
+        local_imports = [imported for imported in entry.get("imports", []) if imported in files]
+        if local_imports:
+            line += f" -> {', '.join(local_imports)}"
+        lines.append(line)
+
+    if len(lines) > INDEX_MAX_PROMPT_FILES:
+        lines = lines[:INDEX_MAX_PROMPT_FILES] + [f"... {len(lines) - INDEX_MAX_PROMPT_FILES} more files"]
+
+    packages = [package for package in index.get("packages", []) if not package.startswith("@radix-ui/")]
+    radix_count = len(index.get("packages", [])) - len(packages)
+    if radix_count:
+        packages.append(f"@radix-ui/* ({radix_count})")
+
+    sections = ["Files (size, exports -> local imports):"] + lines
+    if ui_components:
+        sections.append(f"Shadcn UI in {UI_COMPONENTS_DIR} (pre-installed): {', '.join(ui_components)}")
+    sections.append(f"Installed packages: {', '.join(packages) if packages else 'none'}")
+    return "\n".join(sections)
+
+def task_with_index(task: str, index: Optional[Dict[str, Any]]) -> str:
+    """First user turn of a run: the project index (sent once per run) followed by the task"""
+    if not index:
+        return task
+    return f"<project_index>\n{format_index(index)}\n</project_index>\n\n{task}"
@@ -3,7 +3,7 @@ SYSTEM_PROMPT = """
 
 <mandatory_workflow>
 1. **ALWAYS CHECK FOR EXTERNAL PACKAGES FIRST**: If task requires any package not in this list → terminal("npm install package-name --yes")
-2. **ALWAYS READ EXISTING FILES** (if continuing project) → read_files(["app/page.tsx", "components/*.tsx"])
+2. **ALWAYS READ EXISTING FILES** (if continuing project) → read_files with the files you will change (use the project index when provided)
 3. **ALWAYS ADD 'use client'** as first line for ANY component with hooks/state/events
 4. **MANDATORY COMPLETION**: You MUST call task_complete() as your FINAL action after creating/updating files
 
@@ -38,16 +38,17 @@ EVERYTHING ELSE NEEDS: terminal("npm install package-name --yes")
 - Use TypeScript for all files
 
 **CONTINUING PROJECTS:**
-- ALWAYS read_files(["app/page.tsx"]) first to understand existing structure
+- ALWAYS read the files you will change first (pick them from the project index when provided, otherwise start with app/page.tsx)
 - Read relevant component files before modifying
 - BUILD UPON existing code, don't replace unless necessary
 </critical_rules>
 
 <step_by_step_process>
 1. **PACKAGE CHECK**: Does task need external packages? → terminal("npm install package-name --yes")
-2. **CONTEXT CHECK**: Is this continuing project? → read_files(["app/page.tsx", "components/*.tsx"])
+2. **CONTEXT CHECK**: Is this continuing project? → read_files with only the files you need (see project index)
 3. **FILE CREATION**: create_or_update_files with proper 'use client' directives
-4. **MANDATORY FINAL STEP**: task_complete(summary, files_created, completed=true) - THIS IS REQUIRED
+4. **COMPILE CHECK**: If create_or_update_files reports COMPILE ERRORS → fix them with create_or_update_files first
+5. **MANDATORY FINAL STEP**: task_complete(summary, files_created, completed=true) - THIS IS REQUIRED
 </step_by_step_process>
 
 <requirements>
@@ -0,0 +1,157 @@
+import os
+import json
+import time
+from typing import Dict, Any, List, Callable, Tuple, Optional
+from langchain_core.messages import AIMessage, ToolMessage
+from .verify import COMPILE_ERROR_MARKER
+
+# Configuration
+MODEL_ROUTING_ENABLED = os.getenv("MODEL_ROUTING_ENABLED", "true").lower() == "true"
+FAST_MODEL = os.getenv("FAST_MODEL", "google/gemini-2.5-flash-lite")
+# Optional pricing for cost accounting: {"model": [input_usd_per_million, output_usd_per_million]}
+MODEL_PRICES: Dict[str, List[float]] = json.loads(os.getenv("MODEL_PRICES", "{}"))
+
+# Step kinds
+STEP_READ = "read"          # reading existing code before making changes
+STEP_GENERATE = "generate"  # installing packages and writing files
+STEP_COMPLETE = "complete"  # wrapping up with task_complete after files were written
+
+# Step kinds cheap enough for the fast model
+FAST_STEPS = {STEP_READ, STEP_COMPLETE}
+
+# Tools bound for the fast model; it cannot write files
+FAST_TOOLS = {"read_files", "terminal", "task_complete"}
+# Fast-tier-only tool the fast model calls to hand the step to the requested model
+ESCALATION_TOOL = "escalate_to_primary"
+
+# Model tiers
+TIER_FAST = "fast"
+TIER_PRIMARY = "primary"
+
+# ========================
+# STEP CLASSIFICATION
+# ========================
+
+def _last_tool_names(messages: List[Any]) -> List[str]:
+    """Names of the tools called by the most recent AI message"""
+    for message in reversed(messages):
+        if isinstance(message, AIMessage):
+            return [tool_call["name"] for tool_call in message.tool_calls]
+    return []
+
+def _last_tool_results(messages: List[Any]) -> List[str]:
+    """Contents of the tool results that follow the most recent AI message"""
+    results = []
+    for message in reversed(messages):
+        if isinstance(message, AIMessage):
+            break
+        if isinstance(message, ToolMessage):
+            results.append(str(message.content))
+    return results
+
+def classify_step(state: Dict[str, Any]) -> str:
+    """Predict what kind of step the next LLM turn will be"""
+    messages = state["messages"]
+    last_tools = _last_tool_names(messages)
+
+    if not last_tools:
+        # First turn: continuing sessions start by reading, new ones start building
+        return STEP_READ if state.get("session_type") == "continuing" else STEP_GENERATE
+
+    if "create_or_update_files" in last_tools:
+        # Compile errors mean another round of file generation
+        if any(COMPILE_ERROR_MARKER in result for result in _last_tool_results(messages)):
+            return STEP_GENERATE
+        # Files were just written; the next turn is usually task_complete
+        return STEP_COMPLETE
+
+    return STEP_GENERATE
+
+# ========================
+# ACCOUNTING
+# ========================
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int) -> Optional[float]:
+    """Estimate USD cost of a call from MODEL_PRICES, or None if the model is not priced"""
+    prices = MODEL_PRICES.get(model)
+    if not prices:
+        return None
+    return (input_tokens * prices[0] + output_tokens * prices[1]) / 1_000_000
+
+def _step_metric(kind: str, model: str, tier: str, latency: float, response: AIMessage) -> Dict[str, Any]:
+    usage = getattr(response, "usage_metadata", None) or {}
+    input_tokens = usage.get("input_tokens", 0)
+    output_tokens = usage.get("output_tokens", 0)
+    return {
+        "kind": kind,
+        "model": model,
+        "tier": tier,
+        "latency": round(latency, 3),
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cost": estimate_cost(model, input_tokens, output_tokens),
+        "tools": [tool_call["name"] for tool_call in response.tool_calls],
+        "escalated": False,
+    }
+
+def summarize_step_metrics(step_metrics: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Aggregate per-step metrics into per-tier totals"""
+    summary = {"steps": len(step_metrics), "escalations": 0, "tiers": {}}
+    for metric in step_metrics:
+        if metric["escalated"]:
+            summary["escalations"] += 1
+        tier = summary["tiers"].setdefault(metric["tier"], {
+            "calls": 0, "latency": 0.0, "input_tokens": 0, "output_tokens": 0, "cost": 0.0
+        })
+        tier["calls"] += 1
+        tier["latency"] = round(tier["latency"] + metric["latency"], 3)
+        tier["input_tokens"] += metric["input_tokens"]
+        tier["output_tokens"] += metric["output_tokens"]
+        tier["cost"] += metric["cost"] or 0.0
+    return summary
+
+# ========================
+# ROUTING
+# ========================
+
+def _needs_escalation(response: AIMessage) -> bool:
+    """Whether a fast-model response must be redone by the requested model"""
+    if getattr(response, "invalid_tool_calls", None):
+        return True  # Tool call arguments failed to parse
+    if not response.tool_calls:
+        return True
+    # Includes ESCALATION_TOOL: the fast model asked for the step to be redone
+    return any(tool_call["name"] not in FAST_TOOLS for tool_call in response.tool_calls)
+
+def routed_invoke(
+    state: Dict[str, Any],
+    messages: List[Any],
+    invoke_model: Callable[[str, List[Any], str], AIMessage],
+) -> Tuple[AIMessage, List[Dict[str, Any]]]:
+    """Invoke the fast or the requested model for this step, escalating on unusable fast responses
+
+    invoke_model(model, messages, tier) must bind only FAST_TOOLS plus ESCALATION_TOOL for the
+    fast tier, so the fast model never spends a generation on file bodies that would be thrown
+    away. Returns the response to keep and the metrics for every call made.
+    """
+    kind = classify_step(state)
+    primary_model = state["model"]
+    step_metrics = []
+
+    if MODEL_ROUTING_ENABLED and kind in FAST_STEPS and FAST_MODEL != primary_model:
+        started = time.perf_counter()
+        try:
+            response = invoke_model(FAST_MODEL, messages, TIER_FAST)
+        except Exception:
+            # Fast model unavailable; fall through to the requested model
+            response = AIMessage(content="")
+        metric = _step_metric(kind, FAST_MODEL, TIER_FAST, time.perf_counter() - started, response)
+        if not _needs_escalation(response):
+            return response, [metric]
+        metric["escalated"] = True
+        step_metrics.append(metric)
+
+    started = time.perf_counter()
+    response = invoke_model(primary_model, messages, TIER_PRIMARY)
+    step_metrics.append(_step_metric(kind, primary_model, TIER_PRIMARY, time.perf_counter() - started, response))
+    return response, step_metrics
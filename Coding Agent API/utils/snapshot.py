@@ -0,0 +1,138 @@
+import os
+import json
+import tempfile
+from datetime import datetime
+from typing import Dict, Any, Iterable, Optional
+
+import xxhash
+import zstandard
+
+# Configuration
+SNAPSHOT_DIR = os.getenv(
+    "SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".snapshots")
+)
+SNAPSHOT_COMPRESSION_LEVEL = int(os.getenv("SNAPSHOT_COMPRESSION_LEVEL", "3"))
+SNAPSHOT_KEEP_VERSIONS = int(os.getenv("SNAPSHOT_KEEP_VERSIONS", "20"))  # Manifests kept per project
+
+# ========================
+# SNAPSHOT STORE
+# ========================
+
+def _atomic_write(path: str, data: bytes) -> None:
+    """Write bytes to path atomically so readers never see partial files"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class SnapshotStore:
+    """Content-addressed, zstd-compressed store of project file trees on the local filesystem
+
+    Layout:
+        <root>/blobs/<aa>/<digest>.zst            - file bodies, shared by every project and version
+        <root>/projects/<key>/versions/<n>.json   - manifest mapping file path -> blob digest
+        <root>/projects/<key>/HEAD                - latest version number
+    """
+
+    def __init__(self, root: str = SNAPSHOT_DIR, level: int = SNAPSHOT_COMPRESSION_LEVEL, keep_versions: int = SNAPSHOT_KEEP_VERSIONS):
+        self.root = root
+        self.level = level
+        self.keep_versions = keep_versions
+
+    # ---- blobs ----
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, "blobs", digest[:2], f"{digest}.zst")
+
+    def put_blob(self, content: str) -> str:
+        """Store a file body and return its digest (no-op if already stored)"""
+        data = content.encode("utf-8")
+        digest = xxhash.xxh3_128_hexdigest(data)
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            compressed = zstandard.ZstdCompressor(level=self.level).compress(data)
+            _atomic_write(path, compressed)
+        return digest
+
+    def get_blob(self, digest: str) -> str:
+        """Read a file body back by digest"""
+        with open(self._blob_path(digest), "rb") as f:
+            return zstandard.ZstdDecompressor().decompress(f.read()).decode("utf-8")
+
+    # ---- manifests ----
+
+    @staticmethod
+    def _project_key(user_id: str, project_id: str) -> str:
+        return xxhash.xxh3_64_hexdigest(f"{user_id}/{project_id}".encode("utf-8"))
+
+    def _project_dir(self, user_id: str, project_id: str) -> str:
+        return os.path.join(self.root, "projects", self._project_key(user_id, project_id))
+
+    def latest(self, user_id: str, project_id: str) -> Optional[Dict[str, Any]]:
+        """Return the latest manifest for a project, or None if it has never been snapshotted"""
+        project_dir = self._project_dir(user_id, project_id)
+        try:
+            with open(os.path.join(project_dir, "HEAD")) as f:
+                version = int(f.read().strip())
+            with open(os.path.join(project_dir, "versions", f"{version}.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, user_id: str, project_id: str, files: Dict[str, str], deleted: Iterable[str] = ()) -> Optional[Dict[str, Any]]:
+        """Merge files into the project's latest snapshot, drop deleted paths, and record a new version if anything changed
+
+        Returns the latest manifest (None if the project has no files).
+        """
+        manifest = self.latest(user_id, project_id)
+        tree = dict(manifest["files"]) if manifest else {}
+
+        for path in deleted:
+            tree.pop(path, None)
+        for path, content in files.items():
+            tree[path] = self.put_blob(content)
+
+        if tree == (manifest["files"] if manifest else {}):
+            return manifest
+
+        version = manifest["version"] + 1 if manifest else 1
+        new_manifest = {
+            "user_id": user_id,
+            "project_id": project_id,
+            "version": version,
+            "created_at": datetime.now().isoformat(),
+            "files": tree,
+        }
+        project_dir = self._project_dir(user_id, project_id)
+        _atomic_write(
+            os.path.join(project_dir, "versions", f"{version}.json"),
+            json.dumps(new_manifest).encode("utf-8")
+        )
+        _atomic_write(os.path.join(project_dir, "HEAD"), str(version).encode("utf-8"))
+        self._prune_versions(project_dir, version)
+        return new_manifest
+
+    def _prune_versions(self, project_dir: str, head: int) -> None:
+        """Remove manifests older than the last keep_versions (blobs are shared and kept)"""
+        versions_dir = os.path.join(project_dir, "versions")
+        for name in os.listdir(versions_dir):
+            number, ext = os.path.splitext(name)
+            if ext == ".json" and number.isdigit() and int(number) <= head - self.keep_versions:
+                try:
+                    os.remove(os.path.join(versions_dir, name))
+                except FileNotFoundError:
+                    pass  # Another worker pruned it first
+
+    def load_files(self, manifest: Dict[str, Any]) -> Dict[str, str]:
+        """Materialize every file body referenced by a manifest"""
+        return {path: self.get_blob(digest) for path, digest in manifest["files"].items()}
+
+# Shared store instance
+snapshot_store = SnapshotStore()
@@ -0,0 +1,24 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable
+
+
+def start_thread(fn: Callable[[], Any], name: str) -> Future:
+    """Run fn on its own daemon thread and return a Future for its result
+
+    Used for blocking work that can be long or bursty (LLM calls, sandbox boots, whole
+    builds): a thread each means no pool size silently caps or queues it, and it never
+    holds up the short calls that share asyncio's default executor.
+    """
+    future: Future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True, name=name).start()
+    return future
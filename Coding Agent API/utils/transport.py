@@ -0,0 +1,278 @@
+import os
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Dict, Any, List, Callable, Optional
+
+import openai
+
+from .threads import start_thread
+
+# Configuration
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "180"))  # Per-attempt deadline in seconds
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "1.0"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "20.0"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "60"))
+# Comma-separated models tried in order when the requested model is failing
+LLM_FALLBACK_MODELS = [m.strip() for m in os.getenv("LLM_FALLBACK_MODELS", "").split(",") if m.strip()]
+
+# Errors worth retrying or failing over on (rate limits, 5xx, network, timeouts)
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    TimeoutError,
+)
+
+class LLMTimeoutError(TimeoutError):
+    """Raised when an LLM call misses its deadline"""
+
+class DeadlineExceededError(LLMTimeoutError):
+    """Raised when the caller's own deadline ran out; says nothing about the model's health"""
+
+class CircuitOpenError(Exception):
+    """Raised when every candidate model has an open circuit"""
+
+# ========================
+# LATENCY TRACKING
+# ========================
+
+class LatencyTracker:
+    """Keeps a sliding window of successful call latencies per model"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, latency: float) -> None:
+        with self._lock:
+            self._samples.setdefault(model, deque(maxlen=self.window)).append(latency)
+
+    def percentile(self, model: str, percentile: float) -> Optional[float]:
+        """Latency at the given percentile, or None if no samples yet"""
+        with self._lock:
+            samples = sorted(self._samples.get(model, ()))
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * percentile / 100))
+        return samples[index]
+
+    def count(self, model: str) -> int:
+        with self._lock:
+            return len(self._samples.get(model, ()))
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Tail-latency summary for every model seen"""
+        with self._lock:
+            models = list(self._samples)
+        return {
+            model: {
+                "count": self.count(model),
+                "p50": self.percentile(model, 50),
+                "p95": self.percentile(model, 95),
+                "p99": self.percentile(model, 99),
+                "max": self.percentile(model, 100),
+            }
+            for model in models
+        }
+
+# ========================
+# CIRCUIT BREAKER
+# ========================
+
+class CircuitBreaker:
+    """Per-model circuit breaker: opens after consecutive failures, probes again after a cool-down"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go through right now"""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            return self.state != self.OPEN
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+# ========================
+# TRANSPORT
+# ========================
+
+class LLMTransport:
+    """Calls an LLM with deadlines, jittered retries, optional hedging, circuit breaking and fallbacks
+
+    build_llm(model, timeout, **llm_options) must return a runnable whose invoke(messages) performs
+    a single request without retries of its own.
+    """
+
+    def __init__(
+        self,
+        build_llm: Callable[[str, float], Any],
+        fallback_models: Optional[List[str]] = None,
+        call_timeout: float = LLM_CALL_TIMEOUT,
+        max_retries: int = LLM_MAX_RETRIES,
+        hedge_enabled: bool = LLM_HEDGE_ENABLED,
+    ):
+        self.build_llm = build_llm
+        self.fallback_models = LLM_FALLBACK_MODELS if fallback_models is None else fallback_models
+        self.call_timeout = call_timeout
+        self.max_retries = max_retries
+        self.hedge_enabled = hedge_enabled
+        self.latency = LatencyTracker()
+        self.counters = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "fallbacks": 0, "failures": 0, "deadline_exceeded": 0}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            return self._breakers.setdefault(model, CircuitBreaker())
+
+    def invoke(self, model: str, messages: List[Any], deadline: Optional[float] = None, **llm_options):
+        """Invoke model, failing over to fallback models when it is unavailable
+
+        deadline is an absolute time.monotonic() value bounding the whole call including retries;
+        llm_options are passed through to build_llm.
+        """
+        self._count("calls")
+        candidates = [model] + [m for m in self.fallback_models if m != model]
+        last_error: Optional[Exception] = None
+
+        for index, candidate in enumerate(candidates):
+            if not self.breaker(candidate).allow():
+                continue
+            if index > 0:
+                self._count("fallbacks")
+            try:
+                return self._invoke_with_retries(candidate, messages, deadline, llm_options)
+            except DeadlineExceededError:
+                # The caller is out of time; fallback models would not help
+                self._count("deadline_exceeded")
+                raise
+            except RETRYABLE_ERRORS as e:
+                last_error = e
+
+        self._count("failures")
+        if last_error:
+            raise last_error
+        raise CircuitOpenError(f"All models are temporarily unavailable: {', '.join(candidates)}")
+
+    def _invoke_with_retries(self, model: str, messages: List[Any], deadline: Optional[float], llm_options: Dict[str, Any]):
+        breaker = self.breaker(model)
+        for attempt in range(self.max_retries + 1):
+            timeout = self.call_timeout
+            deadline_bound = False
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise DeadlineExceededError(f"Deadline exceeded before calling {model}")
+                deadline_bound = remaining < timeout
+                timeout = min(timeout, remaining)
+            try:
+                response = self._attempt(model, messages, timeout, llm_options)
+                breaker.record_success()
+                return response
+            except RETRYABLE_ERRORS as e:
+                if deadline_bound and isinstance(e, (LLMTimeoutError, openai.APITimeoutError)):
+                    # Cut short by the caller's deadline, not a provider failure: keep the circuit closed
+                    raise DeadlineExceededError(str(e)) from e
+                breaker.record_failure()
+                if attempt == self.max_retries or not breaker.allow():
+                    raise
+                self._count("retries")
+                # Full jitter exponential backoff
+                delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+                if deadline is not None:
+                    delay = min(delay, max(0.0, deadline - time.monotonic()))
+                time.sleep(delay)
+
+    def _hedge_delay(self, model: str) -> Optional[float]:
+        """Delay after which a duplicate request is sent, or None when hedging does not apply"""
+        if not self.hedge_enabled or self.latency.count(model) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return self.latency.percentile(model, LLM_HEDGE_PERCENTILE)
+
+    def _attempt(self, model: str, messages: List[Any], timeout: float, llm_options: Dict[str, Any]):
+        """One logical request, optionally hedged with a duplicate once it runs past the latency threshold"""
+        llm = self.build_llm(model, timeout, **llm_options)
+        started = time.monotonic()
+
+        def call():
+            # Latency is measured from when the request actually starts
+            call_started = time.monotonic()
+            response = llm.invoke(messages)
+            return response, time.monotonic() - call_started
+
+        pending = {start_thread(call, name="llm-call")}
+        primary = next(iter(pending))
+
+        hedge_delay = self._hedge_delay(model)
+        if hedge_delay is not None and hedge_delay < timeout:
+            done, _ = wait(pending, timeout=hedge_delay)
+            if not done:
+                self._count("hedges")
+                pending.add(start_thread(call, name="llm-call"))
+
+        last_error: Optional[BaseException] = None
+        while pending:
+            remaining = timeout - (time.monotonic() - started)
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # Losing requests keep running in the background and are discarded
+                    for other in pending:
+                        other.cancel()
+                    if future is not primary:
+                        self._count("hedge_wins")
+                    response, latency = future.result()
+                    self.latency.record(model, latency)
+                    return response
+                last_error = future.exception()
+
+        for future in pending:
+            future.cancel()
+        if last_error is not None and not pending:
+            raise last_error
+        raise LLMTimeoutError(f"{model} did not respond within {timeout:.1f}s")
+
+    def metrics(self) -> Dict[str, Any]:
+        """Counters, tail latencies and circuit states for monitoring"""
+        with self._lock:
+            counters = dict(self.counters)
+            breakers = {model: breaker.state for model, breaker in self._breakers.items()}
+        return {"counters": counters, "latency": self.latency.snapshot(), "circuits": breakers}
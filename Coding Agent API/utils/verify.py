@@ -0,0 +1,146 @@
+import os
+import re
+import html
+import time
+from typing import Dict, Any, List
+from e2b import CommandExitException
+
+# Configuration
+VERIFY_ENABLED = os.getenv("VERIFY_ENABLED", "true").lower() == "true"
+VERIFY_TYPECHECK = os.getenv("VERIFY_TYPECHECK", "false").lower() == "true"
+VERIFY_ROUTE_TIMEOUT = int(os.getenv("VERIFY_ROUTE_TIMEOUT", "30"))  # Seconds per route request
+VERIFY_TYPECHECK_TIMEOUT = int(os.getenv("VERIFY_TYPECHECK_TIMEOUT", "60"))
+VERIFY_MAX_ROUTES = int(os.getenv("VERIFY_MAX_ROUTES", "3"))
+VERIFY_MAX_ERRORS = int(os.getenv("VERIFY_MAX_ERRORS", "5"))
+DEV_SERVER_URL = "http://localhost:3000"
+
+# Prefix of the feedback appended to a tool result when compilation fails
+COMPILE_ERROR_MARKER = "COMPILE ERRORS"
+
+# Lines from the dev server's error page worth showing the model
+ERROR_PATTERN = re.compile(
+    r"(Module not found|Failed to compile|Syntax ?Error|Type ?Error|ReferenceError|Unexpected token|"
+    r"Expected|Can't resolve|is not defined|does not exist|Error:)",
+    re.IGNORECASE
+)
+
+# ========================
+# ROUTE DISCOVERY
+# ========================
+
+def _normalize(path: str) -> str:
+    return path[2:] if path.startswith("./") else path.lstrip("/")
+
+def routes_for_files(paths: List[str]) -> List[str]:
+    """Map changed files to the dev server routes that compile them"""
+    routes = []
+    other_files = False
+    for path in map(_normalize, paths):
+        match = re.match(r"^(?:src/)?app/(?:(.*)/)?page\.(tsx|ts|jsx|js)$", path)
+        if not match:
+            other_files = True
+            continue
+        segments = [segment for segment in (match.group(1) or "").split("/") if segment]
+        # Route groups like (marketing) do not appear in the URL
+        segments = [segment for segment in segments if not (segment.startswith("(") and segment.endswith(")"))]
+        # Dynamic segments cannot be requested without real parameters
+        if any(segment.startswith("[") or segment.startswith("@") for segment in segments):
+            continue
+        route = "/" + "/".join(segments)
+        if route not in routes:
+            routes.append(route)
+
+    # Components, hooks and libs are compiled through the pages that import them
+    if (other_files or not routes) and "/" not in routes:
+        routes.insert(0, "/")
+    return routes[:VERIFY_MAX_ROUTES]
+
+# ========================
+# ERROR EXTRACTION
+# ========================
+
+def extract_errors(page: str) -> List[str]:
+    """Pull readable error lines out of a Next.js dev error page"""
+    text = re.sub(r"<script[^>]*>|</script>", "\n", page)
+    text = re.sub(r"self\.__next_f\.push\(\[\d+,\s*\"", "\n", text)
+    text = re.sub(r"<[^>]+>", " ", text)
+    text = html.unescape(text).replace("\\n", "\n").replace('\\"', '"')
+    errors = []
+    for line in text.splitlines():
+        line = re.sub(r'"\]\)\s*$', "", line.strip())
+        if line and ERROR_PATTERN.search(line) and len(line) < 500 and line not in errors:
+            errors.append(line)
+        if len(errors) >= VERIFY_MAX_ERRORS:
+            break
+    return errors
+
+# ========================
+# COMPILE CHECK
+# ========================
+
+def _check_routes(sandbox, routes: List[str]) -> List[str]:
+    """Request each route from the running dev server and collect errors from failing ones"""
+    script = "; ".join(
+        f"code=$(curl -s -o /tmp/verify_page.html -w '%{{http_code}}' --max-time {VERIFY_ROUTE_TIMEOUT} "
+        f"'{DEV_SERVER_URL}{route}'); echo \"@@ROUTE {route} $code\"; "
+        f"if [ \"$code\" -ge 500 ] 2>/dev/null; then head -c 50000 /tmp/verify_page.html; echo; fi"
+        for route in routes
+    )
+    result = sandbox.commands.run(script, timeout=VERIFY_ROUTE_TIMEOUT * len(routes) + 10)
+
+    errors = []
+    for chunk in (result.stdout or "").split("@@ROUTE ")[1:]:
+        header, _, body = chunk.partition("\n")
+        route, _, code = header.partition(" ")
+        if code.strip().isdigit() and int(code) >= 500:
+            route_errors = extract_errors(body) or [f"HTTP {code.strip()} while rendering"]
+            errors.extend(f"{route}: {error}" for error in route_errors)
+    return errors
+
+def _check_types(sandbox, paths: List[str]) -> List[str]:
+    """Run an incremental type check and keep the errors in the changed files"""
+    try:
+        result = sandbox.commands.run(
+            "npx tsc --noEmit --incremental --pretty false",
+            timeout=VERIFY_TYPECHECK_TIMEOUT
+        )
+    except CommandExitException as e:
+        # tsc exits non-zero when it finds errors
+        result = e
+    changed = tuple(_normalize(path) for path in paths)
+    return [
+        line.strip() for line in (result.stdout or "").splitlines()
+        if "error TS" in line and line.strip().startswith(changed)
+    ][:VERIFY_MAX_ERRORS]
+
+def check_compile(sandbox, paths: List[str]) -> Dict[str, Any]:
+    """Check that the files just written compile, using the sandbox's running dev server"""
+    started = time.perf_counter()
+    routes = routes_for_files(paths)
+    errors: List[str] = []
+    try:
+        errors.extend(_check_routes(sandbox, routes))
+        if VERIFY_TYPECHECK and any(path.endswith((".ts", ".tsx")) for path in paths):
+            errors.extend(_check_types(sandbox, paths))
+    except Exception as e:
+        # A failed check must never fail the build; treat it as inconclusive
+        return {"ok": True, "routes": routes, "errors": [], "skipped": str(e),
+                "duration": round(time.perf_counter() - started, 3)}
+
+    return {
+        "ok": not errors,
+        "routes": routes,
+        "errors": errors[:VERIFY_MAX_ERRORS],
+        "duration": round(time.perf_counter() - started, 3),
+    }
+
+def format_compile_feedback(result: Dict[str, Any]) -> str:
+    """Concise compile-check summary appended to the tool result for the model"""
+    if result["ok"]:
+        return f"Compile check passed for {', '.join(result['routes'])} ({result['duration']}s)."
+    error_lines = "\n".join(f"- {error}" for error in result["errors"])
+    return (
+        f"{COMPILE_ERROR_MARKER} found on {', '.join(result['routes'])} ({result['duration']}s):\n"
+        f"{error_lines}\n"
+        "Fix these errors with create_or_update_files before calling task_complete."
+    )